@@ -1,4 +1,3 @@
-import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 import numpy as np
@@ -6,20 +5,37 @@ from scipy.stats import f_oneway
 import statsmodels.api as sm
 from statsmodels.stats.multicomp import pairwise_tukeyhsd
 
+from imputation import impute, multiple_imputation_anova
+from profiling import profiled, span
+from sparse_exam import load_exam_matrix
+from utils import read_tsv
 
-def fetch_exam_data():
+
+@profiled
+def fetch_exam_data(columns=None, sparse=False):
     """
     Fetches the exam data from the exam_results_2022.tsv file.
 
+    Parameters:
+    - columns (iterable): Only parse the scores of these participant ids, as strings or integers, e.g. `[1, 2]`.
+      Defaults to all participants.
+    - sparse (bool): Return only the attempted scores as a `sparse_exam.ExamMatrix` instead of a dense frame.
+
     Returns:
-    - DataFrame: A pandas DataFrame containing the exam data.
+    - DataFrame: A pandas DataFrame containing the exam data, or an ExamMatrix when `sparse` is True.
 
     Data description:
     - Columns contain the participant IDs and their score in the different categories.
     - Rows contain the category names and participants scores in those categories.
     """
+    if columns is not None:
+        # The header holds the ids as strings, so both paths accept the same ids
+        columns = [str(column) for column in columns]
+    if sparse:
+        return load_exam_matrix('csv/exam_results_2022.tsv', columns)
+
     # load the data
-    data = pd.read_csv('csv/exam_results_2022.tsv', delimiter='\t', index_col=0, decimal=',')
+    data = read_tsv('csv/exam_results_2022.tsv', columns, decimal=',')
 
     # Convert all columns to float, coercing errors to NaN
     data = data.astype(float)
@@ -29,26 +45,25 @@ def fetch_exam_data():
     return data
 
 
-def fill_with_mean(series):
-    """
-    Takes a pandas Series, calculates the mean of non-zero elements,
-    and returns the Series with zeros replaced by this mean.
-    """
-    # print(series)
-    mean = series.mean(skipna=True)
-    return series.replace(np.NAN, mean)
+def main(strategy='row_mean', pooled=False, processes=None):
+    data = fetch_exam_data()
+    data = data.iloc[:data.index.get_loc('sum'), :]
 
+    if pooled:
+        # Multiple imputation pools the ANOVA over imputed data sets drawn from the observed scores, independent
+        # of `strategy`, and is reported next to the single-imputation analysis below
+        result = multiple_imputation_anova(data, num_imputations=20, seed=2022, processes=processes)
+        print(f'Multiple imputation: F-statistic: {result["f_stat"]:.2f}, p-value: {result["p_value"]:.4f}')
 
-def main():
-    data = fetch_exam_data()
-    # for each category, calculate the mean score excluding zeros, fill zeros in each category with the mean
-    data = data.iloc[:data.index.get_loc('sum'), :].apply(fill_with_mean, axis=1)
+    # for each category, fill the questions that were not attempted (zeros) using the chosen strategy
+    data = impute(data, strategy)
 
     # perform the ANOVA test
     groups = [data.loc[category].values for category in data.index]  # Extract groups as arrays
 
     # Perform ANOVA
-    f_stat, p_value = f_oneway(*groups)
+    with span('anova_exam22.f_oneway'):
+        f_stat, p_value = f_oneway(*groups)
     print(f'F-statistic: {f_stat:.2f}, p-value: {p_value:.4f}')
 
     # If ANOVA shows significant differences, proceed with Tukey's HSD
@@ -60,7 +75,8 @@ def main():
         print(len(labels))
 
         # Perform Tukey's HSD
-        tukey_results = pairwise_tukeyhsd(all_values, labels, alpha=0.05)
+        with span('anova_exam22.pairwise_tukeyhsd'):
+            tukey_results = pairwise_tukeyhsd(all_values, labels, alpha=0.05)
         print(tukey_results)
 
         # To plot the results
@@ -0,0 +1,251 @@
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+
+from figures import save_figure
+from profiling import profiled
+from utils import read_tsv
+
+# Upper bound on the number of point-centroid (or point-point) distances held in memory at once
+MAX_DISTANCE_BLOCK = 4_000_000
+
+
+def category_matrix(data):
+    """
+    Sums the three tasks of every category per participant.
+
+    Parameters:
+    - data (DataFrame): Exam scores with `<category>_0..2` rows (and optionally `sum`) and participants as columns.
+
+    Returns:
+    - DataFrame: A participants x categories matrix of points, missing tasks count as 0.
+    """
+    tasks = data.drop(index='sum', errors='ignore').astype(float)
+    totals = tasks.groupby(tasks.index.str[:-2], sort=False).sum()
+    return totals.T
+
+
+def _squared_distances(points, centroids, centroid_norms=None):
+    centroid_norms = (centroids ** 2).sum(axis=1) if centroid_norms is None else centroid_norms
+    distances = (points ** 2).sum(axis=1)[:, None] + centroid_norms[None, :] - 2 * points @ centroids.T
+    return np.maximum(distances, 0)
+
+
+def _blocks(num_rows, num_columns):
+    block = max(1, MAX_DISTANCE_BLOCK // max(1, num_columns))
+    for start in range(0, num_rows, block):
+        yield slice(start, min(start + block, num_rows))
+
+
+def _assign(points, centroids):
+    """
+    Returns the nearest centroid of every point and the squared distance to it, in blocks of points.
+    """
+    labels = np.empty(len(points), dtype=int)
+    nearest = np.empty(len(points))
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    for rows in _blocks(len(points), len(centroids)):
+        distances = _squared_distances(points[rows], centroids, centroid_norms)
+        labels[rows] = distances.argmin(axis=1)
+        nearest[rows] = distances[np.arange(len(distances)), labels[rows]]
+    return labels, nearest
+
+
+def _kmeans_plus_plus(points, k, rng):
+    """
+    Picks the initial centroids with k-means++, each new centroid drawn with probability proportional to the
+    squared distance to the nearest centroid picked so far.
+    """
+    centroids = np.empty((k, points.shape[1]))
+    centroids[0] = points[rng.integers(len(points))]
+    nearest = _assign(points, centroids[:1])[1]
+    for i in range(1, k):
+        total = nearest.sum()
+        if total == 0:
+            centroids[i] = points[rng.integers(len(points))]
+        else:
+            centroids[i] = points[np.searchsorted(np.cumsum(nearest), rng.random() * total, side='right')]
+        nearest = np.minimum(nearest, _assign(points, centroids[i:i + 1])[1])
+    return centroids
+
+
+def _lloyd(points, centroids, max_iterations, tolerance):
+    k = len(centroids)
+    for iteration in range(1, max_iterations + 1):
+        labels, nearest = _assign(points, centroids)
+        sizes = np.bincount(labels, minlength=k)
+        sums = np.stack([np.bincount(labels, weights=points[:, j], minlength=k) for j in range(points.shape[1])],
+                        axis=1)
+        updated = np.where(sizes[:, None] > 0, sums / np.maximum(sizes, 1)[:, None], centroids)
+        # An empty cluster restarts at the point furthest from its centroid
+        for cluster in np.flatnonzero(sizes == 0):
+            farthest = nearest.argmax()
+            updated[cluster] = points[farthest]
+            nearest[farthest] = 0
+        shift = ((updated - centroids) ** 2).sum()
+        centroids = updated
+        if shift <= tolerance:
+            break
+    labels, nearest = _assign(points, centroids)
+    return labels, centroids, nearest.sum(), iteration
+
+
+@profiled
+def kmeans(points, k, num_init=4, max_iterations=100, tolerance=1e-4, seed=None):
+    """
+    Clusters points with k-means, initialised with k-means++ and keeping the best of several runs.
+
+    Parameters:
+    - points (ndarray): A samples x features array.
+    - k (int): The number of clusters.
+    - num_init (int): The number of runs with different initial centroids.
+    - max_iterations (int): The maximum number of Lloyd iterations per run.
+    - tolerance (float): A run stops when the centroids move less than this in total squared distance, relative
+      to the mean variance of the features.
+    - seed (int): Seed for reproducible results.
+
+    Returns:
+    - dict: The `labels` of every point, the `centroids`, the `inertia` (sum of squared distances to the
+      centroids) and the number of `iterations` of the best run.
+    """
+    points = np.asarray(points, dtype=float)
+    if not 1 <= k <= len(points):
+        raise ValueError(f'k must be between 1 and the number of points ({len(points)}), got {k}')
+    scaled_tolerance = tolerance * points.var(axis=0).mean()
+    best = None
+    for run_seed in np.random.SeedSequence(seed).spawn(num_init):
+        centroids = _kmeans_plus_plus(points, k, np.random.default_rng(run_seed))
+        labels, centroids, inertia, iterations = _lloyd(points, centroids, max_iterations, scaled_tolerance)
+        if best is None or inertia < best['inertia']:
+            best = {'labels': labels, 'centroids': centroids, 'inertia': inertia, 'iterations': iterations}
+    return best
+
+
+@profiled
+def silhouette_score(points, labels, sample_size=2000, seed=None):
+    """
+    Computes the mean silhouette coefficient of a clustering.
+
+    The coefficient of a point compares its mean distance to the other points of its cluster with the mean
+    distance to the points of the nearest other cluster. For large data it is averaged over a random sample of
+    points, each still compared against all points.
+
+    Parameters:
+    - points (ndarray): A samples x features array.
+    - labels (ndarray): The cluster of every point.
+    - sample_size (int): The number of points to average over, or None for all points.
+    - seed (int): Seed for the sample.
+
+    Returns:
+    - float: The mean silhouette coefficient, between -1 and 1.
+    """
+    points = np.asarray(points, dtype=float)
+    labels = np.asarray(labels)
+    k = labels.max() + 1
+    sizes = np.bincount(labels, minlength=k)
+    if np.count_nonzero(sizes) < 2:
+        raise ValueError('The silhouette needs at least 2 non-empty clusters')
+    samples = np.arange(len(points))
+    if sample_size is not None and sample_size < len(points):
+        samples = np.random.default_rng(seed).choice(len(points), sample_size, replace=False)
+    one_hot = np.zeros((len(points), k))
+    one_hot[np.arange(len(points)), labels] = 1
+    point_norms = (points ** 2).sum(axis=1)
+
+    coefficients = np.empty(len(samples))
+    for rows in _blocks(len(samples), len(points)):
+        sample = samples[rows]
+        distances = np.sqrt(_squared_distances(points[sample], points, point_norms))
+        # Mean distance to every cluster, leaving the point itself out of its own cluster
+        own = labels[sample]
+        totals = distances @ one_hot
+        counts = np.broadcast_to(sizes, totals.shape).astype(float).copy()
+        counts[np.arange(len(sample)), own] -= 1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = totals / counts
+        within = means[np.arange(len(sample)), own]
+        means[np.arange(len(sample)), own] = np.inf
+        means[:, sizes == 0] = np.inf
+        between = means.min(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            coefficient = (between - within) / np.maximum(within, between)
+        # Points alone in their cluster have a coefficient of 0
+        coefficients[rows] = np.where(counts[np.arange(len(sample)), own] > 0, np.nan_to_num(coefficient), 0)
+    return coefficients.mean()
+
+
+@profiled
+def cluster_profiles(data, k_values=range(2, 9), seed=None, sample_size=2000):
+    """
+    Groups participants by their points per exam category, choosing the number of clusters by silhouette.
+
+    Parameters:
+    - data (DataFrame): Exam scores with `<category>_0..2` rows and participants as columns.
+    - k_values (iterable): The numbers of clusters to try.
+    - seed (int): Seed for reproducible results.
+    - sample_size (int): The number of participants the silhouette is averaged over, see `silhouette_score`.
+
+    Returns:
+    - tuple: The cluster of every participant (Series indexed by participant id), the centroid profiles
+      (DataFrame with clusters as rows and categories as columns, plus the cluster `size`) and the silhouette of
+      every k tried (Series indexed by k).
+    """
+    matrix = category_matrix(data)
+    points = matrix.to_numpy()
+    k_values = [k for k in k_values if 2 <= k < len(points)]
+    if not k_values:
+        raise ValueError('No k to try, k must be at least 2 and below the number of participants')
+    seeds = np.random.default_rng(seed).integers(2 ** 32, size=len(k_values))
+    results, scores = {}, {}
+    for k, k_seed in zip(k_values, seeds):
+        results[k] = kmeans(points, k, seed=k_seed)
+        scores[k] = silhouette_score(points, results[k]['labels'], sample_size, seed=k_seed)
+    scores = pd.Series(scores, name='silhouette')
+    scores.index.name = 'k'
+    best = results[scores.idxmax()]
+
+    assignments = pd.Series(best['labels'], index=matrix.index, name='cluster')
+    centroids = pd.DataFrame(best['centroids'], columns=matrix.columns)
+    centroids.index.name = 'cluster'
+    centroids['size'] = np.bincount(best['labels'], minlength=len(centroids))
+    return assignments, centroids, scores
+
+
+@profiled
+def plot_centroids(centroids, title='Performance profiles', save_name='cluster_profiles'):
+    """
+    Plots the average points per category of every cluster.
+
+    Parameters:
+    - centroids (DataFrame): The centroid profiles returned by `cluster_profiles`.
+    - title (str): The title of the plot.
+    - save_name (str): The file name of the plot in `./plots`, without extension, or None to leave the figure open.
+    """
+    profiles = centroids.drop(columns='size')
+    profiles.columns = [' '.join(column.split('_')).capitalize() for column in profiles.columns]
+    profiles = profiles.reset_index().melt(id_vars='cluster', var_name='Category', value_name='Average points')
+    profiles['cluster'] = profiles['cluster'].map(lambda cluster: f'Cluster {cluster} (n={centroids["size"][cluster]})')
+
+    sns.set(style="whitegrid")
+    plt.figure(figsize=(14, 8))
+    graph = sns.barplot(data=profiles, x='Category', y='Average points', hue='cluster', palette="viridis")
+    graph.set_xticks(graph.get_xticks())
+    graph.set_xticklabels(graph.get_xticklabels(), rotation=30, ha='right')
+    graph.legend(title='')
+    plt.title(f"{title}")
+    plt.tight_layout()
+    if save_name is not None:
+        save_figure(save_name)
+
+
+def main():
+    data = read_tsv('csv/exam_results_2022.tsv', decimal=',').astype(float)
+    assignments, centroids, scores = cluster_profiles(data, seed=2022)
+    print(scores.round(3).to_string())
+    print(centroids.round(2).to_string())
+    plot_centroids(centroids)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+
+import test
+from figures import save_figure
+from profiling import profiled
+from schema import parse_column, question_schema
+from screening import LIKERT_TOPICS
+
+# Upper bound on the number of one-hot entries held in memory at once
+MAX_ONE_HOT = 4_000_000
+
+
+def ordinal_columns(data, topics=None, ignore=(0,)):
+    """
+    Collects the ordinal answers of a cohort: every Likert question and the q1-q5 score of each variant.
+
+    Parameters:
+    - data (DataFrame): A loaded cohort.
+    - topics (list): The Likert topics to include, defaults to `screening.LIKERT_TOPICS`.
+    - ignore (tuple): Answer codes that are not on the scale and become NaN, by default 'Not watched', as in
+      `screening.answer_patterns`.
+
+    Returns:
+    - DataFrame: The answer codes indexed by participant id, NaN where a participant did not answer or gave an
+      ignored answer, so pairwise deletion leaves them out. One `score_<variant>` column per variant holds the
+      correct answers out of 5, counting unanswered questions as wrong, so it is never NaN.
+    """
+    schema = question_schema(data)
+    topics = LIKERT_TOPICS if topics is None else topics
+    positions = [position for position, column in enumerate(schema.columns)
+                 if not schema.multi_select[position] and parse_column(column)[0] in topics]
+    codes = schema.codes[:, positions]
+    columns = pd.DataFrame(np.where(np.isin(codes, ignore), np.nan, codes), index=schema.participants,
+                           columns=[schema.column(position) for position in positions])
+    for variant in ['proc', 'virt']:
+        try:
+            scores = schema.correct_matrix(schema.positions('q', variant)).sum(axis=1)
+        except KeyError:
+            continue
+        columns[f'score_{variant}'] = scores.astype(float)
+    return columns
+
+
+def _levels(values):
+    """
+    Replaces the values of every column with dense level codes 0, 1, ... in sorted order, -1 for NaN.
+    """
+    levels = np.full(values.shape, -1)
+    num_levels = np.zeros(values.shape[1], dtype=int)
+    for column in range(values.shape[1]):
+        observed = ~np.isnan(values[:, column])
+        unique, levels[observed, column] = np.unique(values[observed, column], return_inverse=True)
+        num_levels[column] = len(unique)
+    return levels, num_levels.max(initial=1)
+
+
+def contingency_tables(values):
+    """
+    Counts the joint levels of every pair of columns in one matrix product.
+
+    Parameters:
+    - values (ndarray): A participants x columns array of ordinal values, NaN where missing.
+
+    Returns:
+    - ndarray: A columns x columns x levels x levels array, the contingency table of each pair of columns over
+      the participants that answered both, with levels in sorted order of the values.
+    """
+    levels, num_levels = _levels(np.asarray(values, dtype=float))
+    num_participants, num_columns = levels.shape
+    width = num_columns * num_levels
+    tables = np.zeros((width, width))
+    # The one-hot matrix is built and multiplied in blocks of participants to bound memory
+    block = max(1, MAX_ONE_HOT // width)
+    for start in range(0, num_participants, block):
+        rows = levels[start:start + block]
+        one_hot = np.zeros((len(rows), num_columns, num_levels))
+        participants, columns = np.nonzero(rows >= 0)
+        one_hot[participants, columns, rows[participants, columns]] = 1
+        one_hot = one_hot.reshape(len(rows), width)
+        tables += one_hot.T @ one_hot
+    return tables.reshape(num_columns, num_levels, num_columns, num_levels).transpose(0, 2, 1, 3)
+
+
+def _midranks(counts):
+    # The average rank of each level given the number of values per level, along the last axis
+    return np.cumsum(counts, axis=-1) - (counts - 1) / 2
+
+
+def spearman_from_tables(tables):
+    """
+    Spearman's rho of every pair, the Pearson correlation of the tie-averaged ranks, from contingency tables.
+    """
+    rows, columns = tables.sum(axis=3), tables.sum(axis=2)
+    total = rows.sum(axis=2)
+    mean_rank = (total + 1) / 2
+    row_deviation = _midranks(rows) - mean_rank[..., None]
+    column_deviation = _midranks(columns) - mean_rank[..., None]
+    covariance = np.einsum('ijab,ija,ijb->ij', tables, row_deviation, column_deviation)
+    row_variance = (rows * row_deviation ** 2).sum(axis=2)
+    column_variance = (columns * column_deviation ** 2).sum(axis=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return covariance / np.sqrt(row_variance * column_variance)
+
+
+def kendall_from_tables(tables):
+    """
+    Kendall's tau-b of every pair from contingency tables, counting concordant and discordant pairs with
+    cumulative sums over the tables.
+    """
+    padded = np.pad(tables, [(0, 0), (0, 0), (0, 1), (1, 1)])
+    # Pairs with both levels higher, and with a higher row level but a lower column level
+    higher = np.flip(np.cumsum(np.cumsum(np.flip(padded, axis=(2, 3)), axis=2), axis=3), axis=(2, 3))
+    lower = np.flip(np.cumsum(np.flip(np.cumsum(padded, axis=3), axis=2), axis=2), axis=2)
+    concordant = (tables * higher[:, :, 1:, 2:]).sum(axis=(2, 3))
+    discordant = (tables * lower[:, :, 1:, :-2]).sum(axis=(2, 3))
+
+    rows, columns = tables.sum(axis=3), tables.sum(axis=2)
+    total = rows.sum(axis=2)
+    pairs = total * (total - 1) / 2
+    row_ties = (rows * (rows - 1) / 2).sum(axis=2)
+    column_ties = (columns * (columns - 1) / 2).sum(axis=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (concordant - discordant) / np.sqrt((pairs - row_ties) * (pairs - column_ties))
+
+
+@profiled
+def rank_correlations(columns, method='spearman'):
+    """
+    Computes the rank correlation matrix of ordinal columns with pairwise deletion.
+
+    Every pair of columns is compared on the participants that answered both, with tied values sharing their
+    average rank, as `scipy.stats.spearmanr` and `scipy.stats.kendalltau` would on each pair. All pairs come out
+    of one matrix product of the one-hot encoded levels, so the cost grows with the number of distinct values
+    rather than with ranking every pair separately. Meant for ordinal data such as Likert answers and scores.
+
+    Parameters:
+    - columns (DataFrame): Ordinal values with participants as rows, NaN where missing, e.g. from
+      `ordinal_columns`.
+    - method (str): `'spearman'` or `'kendall'` (tau-b).
+
+    Returns:
+    - tuple: The correlation matrix and the number of participants behind each entry, both as DataFrames.
+    """
+    methods = {'spearman': spearman_from_tables, 'kendall': kendall_from_tables}
+    if method not in methods:
+        raise ValueError(f"Unknown correlation method '{method}', expected one of {list(methods)}")
+    tables = contingency_tables(columns.to_numpy(dtype=float))
+    names = columns.columns
+    correlations = pd.DataFrame(methods[method](tables), index=names, columns=names)
+    counts = pd.DataFrame(tables.sum(axis=(2, 3)).astype(int), index=names, columns=names)
+    return correlations, counts
+
+
+@profiled
+def cohort_correlations(cohorts, method='spearman'):
+    """
+    Computes the rank correlation matrix of every cohort.
+
+    Parameters:
+    - cohorts (dict): Loaded cohorts by name, e.g. `{'2023': data_2023, '2024': data_2024}`.
+    - method (str): `'spearman'` or `'kendall'`.
+
+    Returns:
+    - DataFrame: The correlation matrices stacked with the cohort name as the outer row level.
+    """
+    return pd.concat({name: rank_correlations(ordinal_columns(data), method)[0] for name, data in cohorts.items()})
+
+
+@profiled
+def plot_heatmap(correlations, title='Rank correlations', save_name='rank_correlations'):
+    """
+    Plots a correlation matrix as an annotated heatmap.
+
+    Parameters:
+    - correlations (DataFrame): The correlation matrix.
+    - title (str): The title of the plot.
+    - save_name (str): The file name of the plot in `./plots`, without extension, or None to leave the figure open.
+    """
+    # Rows taken from a stacked `cohort_correlations` frame carry the columns of all cohorts
+    correlations = correlations.reindex(columns=correlations.index)
+    labels = [' '.join(column.split('_')).capitalize() for column in correlations.index]
+    size = max(8, 0.6 * len(labels))
+    plt.figure(figsize=(size + 2, size))
+    sns.heatmap(correlations, vmin=-1, vmax=1, center=0, cmap='vlag', annot=len(labels) <= 30, fmt='.2f',
+                xticklabels=labels, yticklabels=labels, square=True)
+    plt.title(f"{title}")
+    plt.tight_layout()
+    if save_name is not None:
+        save_figure(save_name)
+
+
+def main():
+    cohorts = {'2023': test.load_data('csv/resultater23.tsv'), '2024': test.load_data('csv/resultater24.tsv')}
+    for method in ['spearman', 'kendall']:
+        correlations = cohort_correlations(cohorts, method)
+        print(correlations.round(2).to_string())
+        for name in cohorts:
+            plot_heatmap(correlations.loc[name], f'{method.capitalize()} correlations {name}',
+                         f'{method}_correlations_{name}')
+
+
+if __name__ == "__main__":
+    main()
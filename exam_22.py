@@ -4,16 +4,25 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 import re
 
+from profiling import profiled
+from quantiles import trim_mask
 from utils import adjust_labels, plot_bargraph
 
 TRIES = 0
 POINTS = 1
 
+# Number of participants cut from each end of the exam sums when filtering
+TRIM = 33
 
-def calculate_scores(data, filtered):
-    if filtered:
+
+@profiled
+def calculate_scores(data, filtered, sketch=None):
+    if filtered and sketch is not None:
+        # Approximate cutoffs from a quantile sketch of the sums, e.g. merged from per-file sketches
+        data = data.loc[:, trim_mask(data.loc['sum'].astype(float), sketch, TRIM)]
+    elif filtered:
         data = data.sort_values(by='sum', axis=1, ascending=False)
-        data = data.iloc[:, 33:-33]
+        data = data.iloc[:, TRIM:-TRIM]
     row_headers = data.index.tolist()
     categories = [elem[:-2] for elem in row_headers[:-1:3]]
     participant_ids = data.columns.tolist()
@@ -42,6 +51,7 @@ def calculate_scores(data, filtered):
     return res_dict
 
 
+@profiled
 def average_score(res_dict):
     avg_points = {category: res_dict[category][POINTS] / res_dict[category][TRIES] for category in res_dict.keys()}
     avg_points = dict(sorted(avg_points.items(), key=lambda item: item[1], reverse=True))
@@ -68,8 +78,9 @@ def main():
     filtered_values = list(filtered_data.values())
     unfiltered_values = list(unfiltered_data.values())
 
-    plot_bargraph(unfiltered_keys, unfiltered_values, "Avg scores", "Exam results unfiltered", "unfiltered_exam_results")
-    plot_bargraph(filtered_keys, filtered_values, "Avg scores", "Exam results filtered", "filtered_exam_results")
+    plot_bargraph("Avg scores", "Exam results unfiltered", "unfiltered_exam_results", unfiltered_keys,
+                  unfiltered_values)
+    plot_bargraph("Avg scores", "Exam results filtered", "filtered_exam_results", filtered_keys, filtered_values)
 
     filtered_data = calculate_scores(data, True)
 
@@ -86,7 +97,7 @@ def main():
     filtered_keys = [item[0] for item in paired_sorted]
     filtered_values = [item[1] for item in paired_sorted]
 
-    plot_bargraph(filtered_keys, filtered_values, "Attempts", "Exam results filtered", "filtered_exam_results_attempts")
+    plot_bargraph("Attempts", "Exam results filtered", "filtered_exam_results_attempts", filtered_keys, filtered_values)
     # filtered_values = list(filtered_data.values()[TRIES])
 
     unfiltered_data = calculate_scores(data, False)
@@ -104,7 +115,8 @@ def main():
     unfiltered_keys = [item[0] for item in paired_sorted]
     unfiltered_values = [item[1] for item in paired_sorted]
 
-    plot_bargraph(unfiltered_keys, unfiltered_values, "Attempts", "Exam results unfiltered", "unfiltered_exam_results_attempts")
+    plot_bargraph("Attempts", "Exam results unfiltered", "unfiltered_exam_results_attempts", unfiltered_keys,
+                  unfiltered_values)
 
 
 
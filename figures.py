@@ -0,0 +1,69 @@
+import os
+from contextlib import contextmanager
+
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+
+PLOT_DIR = './plots'
+
+# Artists below this z-order (bars, heatmap cells, scatter points) are rasterized in thumbnail mode, while text,
+# lines and axes stay vector
+RASTER_ZORDER = 2
+
+_output = None
+
+
+@contextmanager
+def collect(path, svg_dir=None, rasterized=False, dpi=None):
+    """
+    Collects every figure saved with `save_figure` inside the block into one multi-page PDF.
+
+    The PDF is written through a single open file with TrueType fonts embedded once for the whole document, so
+    the full plot set is one streamed write instead of a PNG per figure. Use one block per chapter for
+    per-chapter PDFs.
+
+    Yields the list of the names saved into the PDF so far, one per page, e.g. to check which plots a chapter
+    produced.
+
+    Parameters:
+    - path (str): The path of the PDF, e.g. `'./plots/results_chapter.pdf'`.
+    - svg_dir (str): Also write every figure as `<svg_dir>/<name>.svg` with text kept as text, or None.
+    - rasterized (bool): Rasterize the bars and cells of every figure, for small thumbnail documents.
+    - dpi (int): The resolution of rasterized parts, e.g. 72 for thumbnails. Defaults to matplotlib's setting.
+    """
+    global _output
+    if _output is not None:
+        raise RuntimeError(f"Already collecting figures into {_output['path']}")
+    if svg_dir is not None:
+        os.makedirs(svg_dir, exist_ok=True)
+    with plt.rc_context({'pdf.fonttype': 42, 'svg.fonttype': 'none'}), PdfPages(path) as pages:
+        _output = {'path': path, 'pages': pages, 'saved': [], 'svg_dir': svg_dir, 'rasterized': rasterized,
+                   'dpi': dpi}
+        try:
+            yield _output['saved']
+        finally:
+            _output = None
+
+
+def save_figure(name, figure=None, **options):
+    """
+    Saves a figure as `./plots/<name>.png`, or as the next page of the PDF when inside `collect`.
+
+    Parameters:
+    - name (str): The file name of the plot without extension, also used for the SVG file.
+    - figure (Figure): The figure to save, defaults to the current figure.
+    - options: Extra keyword arguments for `Figure.savefig`, e.g. `bbox_inches`.
+    """
+    figure = plt.gcf() if figure is None else figure
+    if _output is None:
+        figure.savefig(f'{PLOT_DIR}/{name}.png', **options)
+        return
+    if _output['rasterized']:
+        for ax in figure.axes:
+            ax.set_rasterization_zorder(RASTER_ZORDER)
+    if _output['dpi'] is not None:
+        options.setdefault('dpi', _output['dpi'])
+    _output['pages'].savefig(figure, **options)
+    _output['saved'].append(name)
+    if _output['svg_dir'] is not None:
+        figure.savefig(os.path.join(_output['svg_dir'], f'{name}.svg'), format='svg', **options)
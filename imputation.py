@@ -0,0 +1,169 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy.stats import f as f_distribution
+from scipy.stats import f_oneway
+
+from profiling import profiled
+from shared_data import map_shared
+
+# Upper bound on the number of participant pairs held in memory when computing k-NN distances
+MAX_DISTANCE_BLOCK = 4_000_000
+
+
+def _row_mean(values):
+    return np.where(np.isnan(values), np.nanmean(values, axis=1, keepdims=True), values)
+
+
+def _column_mean(values):
+    return np.where(np.isnan(values), np.nanmean(values, axis=0, keepdims=True), values)
+
+
+def _median(values):
+    return np.where(np.isnan(values), np.nanmedian(values, axis=1, keepdims=True), values)
+
+
+def _knn(values, k=5):
+    """
+    Replaces each missing score with the mean score of the k most similar participants that answered the question.
+
+    Participants are compared on the questions both of them answered, with the squared distance scaled up by the
+    share of questions they have in common so participants with few answers are not favoured.
+    """
+    participants = values.T
+    observed = ~np.isnan(participants)
+    filled = np.where(observed, participants, 0.0)
+    squared = filled ** 2
+    imputed = participants.copy()
+    for question in range(participants.shape[1]):
+        recipients = np.flatnonzero(~observed[:, question])
+        donors = np.flatnonzero(observed[:, question])
+        if recipients.size == 0 or donors.size == 0:
+            continue
+        num_neighbours = min(k, donors.size)
+        block = max(1, MAX_DISTANCE_BLOCK // donors.size)
+        for start in range(0, recipients.size, block):
+            rows = recipients[start:start + block]
+            common = observed[rows].astype(float) @ observed[donors].T.astype(float)
+            distance = (squared[rows] @ observed[donors].T + observed[rows] @ squared[donors].T
+                        - 2 * filled[rows] @ filled[donors].T)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                distance = np.where(common > 0, distance * participants.shape[1] / common, np.inf)
+            nearest = np.argpartition(distance, num_neighbours - 1, axis=1)[:, :num_neighbours]
+            imputed[rows, question] = participants[donors[nearest], question].mean(axis=1)
+    return imputed.T
+
+
+STRATEGIES = {
+    'row_mean': _row_mean,
+    'column_mean': _column_mean,
+    'median': _median,
+    'knn': _knn,
+}
+
+
+@profiled
+def impute(data, strategy='row_mean', **options):
+    """
+    Fills the missing scores of an exam matrix.
+
+    Parameters:
+    - data (DataFrame): Exam scores with questions as rows and participants as columns, with NaN for questions
+      that were not attempted, as returned by `anova_exam22.fetch_exam_data` without the `sum` row.
+    - strategy (str): How to fill the missing scores:
+      - 'row_mean': the mean score of the question (the original behaviour of `anova_exam22.main`).
+      - 'column_mean': the mean score of the participant over the questions they answered.
+      - 'median': the median score of the question.
+      - 'knn': the mean score of the k most similar participants, `k` defaults to 5.
+    - options: Extra keyword arguments for the strategy.
+
+    Returns:
+    - DataFrame: The exam scores with the missing values filled in.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown imputation strategy '{strategy}', expected one of {list(STRATEGIES)}")
+    values = data.to_numpy(dtype=float)
+    with warnings.catch_warnings():
+        # Questions nobody answered stay NaN instead of warning about empty slices
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        imputed = STRATEGIES[strategy](values, **options)
+    return pd.DataFrame(imputed, index=data.index, columns=data.columns)
+
+
+def _bootstrap_draw(values, rng):
+    """
+    Draws one imputation with the approximate Bayesian bootstrap.
+
+    Every question first gets a bootstrap resample of its observed scores, then each missing score is drawn from
+    that resample. Resampling before drawing carries the uncertainty about the score distribution into the
+    spread between imputations, which the pooled test relies on.
+    """
+    observed_sorted = np.sort(values, axis=1)
+    num_observed = np.count_nonzero(~np.isnan(values), axis=1)
+    width = max(1, num_observed.max())
+    rows = np.arange(values.shape[0])[:, None]
+    bootstrap = observed_sorted[rows, (rng.random((values.shape[0], width)) * num_observed[:, None]).astype(int)]
+    missing_rows, missing_columns = np.nonzero(np.isnan(values) & (num_observed[:, None] > 0))
+    picks = (rng.random(missing_rows.size) * num_observed[missing_rows]).astype(int)
+    imputed = values.copy()
+    imputed[missing_rows, missing_columns] = bootstrap[missing_rows, picks]
+    return imputed
+
+
+def _imputed_anova(arrays, seed):
+    imputed = _bootstrap_draw(arrays['values'], np.random.default_rng(seed))
+    f_stat, _ = f_oneway(*imputed)
+    return f_stat
+
+
+def pool_anova(f_stats, df_between):
+    """
+    Combines the F-statistics of the ANOVA on each imputed data set with the D2 rule of Li, Meng, Raghunathan and
+    Rubin (1991).
+
+    Parameters:
+    - f_stats (array-like): The F-statistic of each imputed data set.
+    - df_between (int): The numerator degrees of freedom of the ANOVA, the number of groups minus one.
+
+    Returns:
+    - tuple: The pooled F-statistic, its denominator degrees of freedom and the p-value.
+    """
+    chi_squared = np.asarray(f_stats, dtype=float) * df_between
+    num_imputations = len(chi_squared)
+    between = (1 + 1 / num_imputations) * np.var(np.sqrt(chi_squared), ddof=1)
+    pooled = (chi_squared.mean() / df_between - (num_imputations + 1) / (num_imputations - 1) * between) / (1 + between)
+    pooled = max(pooled, 0.0)
+    if between == 0:
+        df_within = np.inf
+    else:
+        df_within = df_between ** (-3 / num_imputations) * (num_imputations - 1) * (1 + 1 / between) ** 2
+    return pooled, df_within, f_distribution.sf(pooled, df_between, df_within)
+
+
+@profiled
+def multiple_imputation_anova(data, num_imputations=20, seed=None, processes=None):
+    """
+    Runs the one-way ANOVA across questions on several imputed copies of the exam matrix and pools the results.
+
+    Parameters:
+    - data (DataFrame): Exam scores with questions as rows and participants as columns, with NaN for questions
+      that were not attempted.
+    - num_imputations (int): The number of imputed data sets, at least 2.
+    - seed (int): Seed for reproducible results, independent of the number of processes.
+    - processes (int): The number of worker processes, or None to run in this process. The workers read the
+      exam matrix from shared memory instead of receiving a copy per imputation.
+
+    Returns:
+    - dict: The pooled `f_stat`, `df_between`, `df_within` and `p_value`, and the `f_stats` of every imputation.
+    """
+    if num_imputations < 2:
+        raise ValueError('Multiple imputation needs at least 2 imputations')
+    values = data.to_numpy(dtype=float)
+    seeds = np.random.SeedSequence(seed).spawn(num_imputations)
+    f_stats = map_shared(_imputed_anova, {'values': values}, [(imputation_seed,) for imputation_seed in seeds],
+                         processes)
+    df_between = values.shape[0] - 1
+    f_stat, df_within, p_value = pool_anova(f_stats, df_between)
+    return {'f_stat': f_stat, 'df_between': df_between, 'df_within': df_within, 'p_value': p_value,
+            'f_stats': np.asarray(f_stats)}
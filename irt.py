@@ -0,0 +1,206 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+from numpy.polynomial.hermite_e import hermegauss
+
+from profiling import profiled
+from schema import question_schema
+from utils import read_tsv
+
+MODELS = ['rasch', '2pl']
+
+# Bound on the item intercepts, so items everyone (or no one) answered correctly do not diverge
+MAX_INTERCEPT = 15.0
+
+# Bounds on the discriminations (slopes), which the log-normal prior below keeps well inside on real cohorts
+SLOPE_BOUNDS = (0.1, 5.0)
+
+# Standard deviation of the log-normal prior on the discriminations, centred on 1
+SLOPE_PRIOR_SD = 0.5
+
+# Maximum number of times an EM step is halved before the fit counts as converged
+MAX_HALVINGS = 20
+
+
+def response_matrix(data, variant='proc'):
+    """
+    Scores the q1-q5 answers of a cohort as the README does: participants that chose several answers get 0.
+
+    Parameters:
+    - data (DataFrame): A cohort as read with `utils.read_tsv`. The loaders in `test` and `results_section` turn
+      multiple answers such as `'0,3'` into NaN, so they would be counted as not answered.
+    - variant (str): `'proc'` or `'virt'`.
+
+    Returns:
+    - DataFrame: Participants x items, 1 for a correct answer, 0 for a wrong or multiple answer and NaN where
+      the participant did not answer.
+    """
+    schema = question_schema(data)
+    positions = schema.positions('q', variant)
+    columns = [schema.column(position) for position in positions]
+    scored = schema.correct_matrix(positions).astype(float)
+    multiple = data.loc[schema.participants, columns].apply(lambda answers: answers.astype(str).str.contains(','))
+    scored[np.isnan(schema.codes[:, positions]) & ~multiple.to_numpy()] = np.nan
+    return pd.DataFrame(scored, index=schema.participants, columns=columns)
+
+
+def _posterior(correct, answered, slopes, intercepts, nodes, log_weights):
+    # Participants x nodes posterior weights and the marginal log-likelihood
+    logits = nodes[:, None] * slopes[None, :] + intercepts[None, :]
+    log_p = -np.logaddexp(0, -logits)
+    log_q = -np.logaddexp(0, logits)
+    log_likelihood = correct @ log_p.T + (answered - correct) @ log_q.T + log_weights
+    marginal = np.logaddexp.reduce(log_likelihood, axis=1)
+    return np.exp(log_likelihood - marginal[:, None]), marginal.sum()
+
+
+def _log_prior(slopes, common_slope):
+    # Log-normal prior on the discriminations, counted once for the shared Rasch discrimination
+    log_slopes = np.log(slopes[:1] if common_slope else slopes)
+    return -(log_slopes ** 2).sum() / (2 * SLOPE_PRIOR_SD ** 2)
+
+
+def _newton_step(expected_correct, expected_answered, slopes, intercepts, nodes, common_slope):
+    """
+    One Newton step of the expected complete-data log-posterior for every item at once.
+
+    Returns:
+    - tuple: The changes of the slopes and of the intercepts.
+    """
+    p = 1 / (1 + np.exp(-(nodes[:, None] * slopes[None, :] + intercepts[None, :])))
+    residual = expected_correct - expected_answered * p
+    information = expected_answered * p * (1 - p)
+    theta = nodes[:, None]
+    gradient_slope, gradient_intercept = (residual * theta).sum(axis=0), residual.sum(axis=0)
+    info_ss = (information * theta ** 2).sum(axis=0)
+    info_si = (information * theta).sum(axis=0)
+    info_ii = information.sum(axis=0)
+    # The prior pulls the log-discriminations towards 0, its curvature is taken at its Fisher information
+    prior_gradient = -np.log(slopes) / (SLOPE_PRIOR_SD ** 2 * slopes)
+    prior_information = 1 / (SLOPE_PRIOR_SD ** 2 * slopes ** 2)
+    if common_slope:
+        intercept_step = gradient_intercept / np.maximum(info_ii, 1e-12)
+        slope_step = (gradient_slope.sum() + prior_gradient[0]) / (info_ss.sum() + prior_information[0])
+        return np.full_like(slopes, slope_step), intercept_step
+    gradient_slope = gradient_slope + prior_gradient
+    info_ss = info_ss + prior_information
+    determinant = np.maximum(info_ss * info_ii - info_si ** 2, 1e-12)
+    slope_step = (info_ii * gradient_slope - info_si * gradient_intercept) / determinant
+    intercept_step = (info_ss * gradient_intercept - info_si * gradient_slope) / determinant
+    return slope_step, intercept_step
+
+
+@profiled
+def fit_irt(responses, model='rasch', num_nodes=31, max_iterations=500, tolerance=1e-6):
+    """
+    Fits a Rasch or two-parameter logistic model by marginal maximum a posteriori estimation.
+
+    The abilities are integrated out over a normal distribution with Gauss-Hermite quadrature and the item
+    parameters are estimated with EM, every step being matrix products over all participants, items and
+    quadrature nodes. Missing answers are left out of the likelihood. A log-normal prior keeps the
+    discriminations within `SLOPE_BOUNDS` on small cohorts, and a step is halved whenever it would lower the
+    marginal log-posterior. A `RuntimeWarning` is raised when the fit does not converge.
+
+    Parameters:
+    - responses (DataFrame): Participants x items of 1 (correct), 0 (wrong) or NaN, e.g. from `response_matrix`.
+    - model (str): `'rasch'` (one discrimination shared by all items) or `'2pl'` (one per item).
+    - num_nodes (int): The number of quadrature nodes.
+    - max_iterations (int): The maximum number of EM iterations.
+    - tolerance (float): EM stops when no item parameter changes more than this.
+
+    Returns:
+    - dict: The `items` (difficulty and discrimination per item), the `abilities` (expected a posteriori ability
+      and its standard error per participant), the marginal `log_likelihood`, the number of `iterations` and
+      whether the fit `converged`. Rasch abilities and difficulties are in logits, 2PL abilities are
+      standardised.
+    """
+    if model not in MODELS:
+        raise ValueError(f"Unknown IRT model '{model}', expected one of {MODELS}")
+    values = responses.to_numpy(dtype=float)
+    answered = (~np.isnan(values)).astype(float)
+    correct = np.nan_to_num(values)
+    nodes, weights = hermegauss(num_nodes)
+    log_weights = np.log(weights / weights.sum())
+    common_slope = model == 'rasch'
+
+    num_items = values.shape[1]
+    proportions = np.clip(correct.sum(axis=0) / np.maximum(answered.sum(axis=0), 1), 0.01, 0.99)
+    slopes = np.ones(num_items)
+    intercepts = np.log(proportions / (1 - proportions))
+    posterior, log_likelihood = _posterior(correct, answered, slopes, intercepts, nodes, log_weights)
+    objective = log_likelihood + _log_prior(slopes, common_slope)
+    converged = False
+    for iteration in range(1, max_iterations + 1):
+        expected_correct = posterior.T @ correct
+        expected_answered = posterior.T @ answered
+        slope_step, intercept_step = _newton_step(expected_correct, expected_answered, slopes, intercepts, nodes,
+                                                  common_slope)
+        for _ in range(MAX_HALVINGS):
+            candidate_slopes = np.clip(slopes + slope_step, *SLOPE_BOUNDS)
+            candidate_intercepts = np.clip(intercepts + intercept_step, -MAX_INTERCEPT, MAX_INTERCEPT)
+            candidate_posterior, candidate_likelihood = _posterior(correct, answered, candidate_slopes,
+                                                                   candidate_intercepts, nodes, log_weights)
+            candidate_objective = candidate_likelihood + _log_prior(candidate_slopes, common_slope)
+            if candidate_objective >= objective - 1e-10:
+                break
+            slope_step, intercept_step = slope_step / 2, intercept_step / 2
+        else:
+            # No step along this direction improves the fit any more
+            converged = True
+            break
+        change = max(np.abs(candidate_slopes - slopes).max(), np.abs(candidate_intercepts - intercepts).max())
+        slopes, intercepts = candidate_slopes, candidate_intercepts
+        posterior, log_likelihood, objective = candidate_posterior, candidate_likelihood, candidate_objective
+        if change < tolerance:
+            converged = True
+            break
+    if not converged:
+        warnings.warn(f'The {model} fit did not converge in {max_iterations} iterations', RuntimeWarning)
+
+    ability = posterior @ nodes
+    error = np.sqrt(np.maximum(posterior @ nodes ** 2 - ability ** 2, 0))
+    if common_slope:
+        # Logit scale: the shared discrimination becomes the standard deviation of the abilities
+        scale = slopes[0]
+        items = pd.DataFrame({'difficulty': -intercepts, 'discrimination': 1.0}, index=responses.columns)
+        abilities = pd.DataFrame({'ability': scale * ability, 'se': scale * error}, index=responses.index)
+    else:
+        items = pd.DataFrame({'difficulty': -intercepts / slopes, 'discrimination': slopes}, index=responses.columns)
+        abilities = pd.DataFrame({'ability': ability, 'se': error}, index=responses.index)
+    return {'items': items, 'abilities': abilities, 'log_likelihood': log_likelihood, 'iterations': iteration,
+            'converged': converged}
+
+
+@profiled
+def cohort_irt(cohorts, variant='proc', model='rasch'):
+    """
+    Fits the model to every cohort separately.
+
+    Parameters:
+    - cohorts (dict): Cohorts read with `utils.read_tsv` by name, e.g. `{'2023': data_2023, '2024': data_2024}`.
+    - variant (str): `'proc'` or `'virt'`.
+    - model (str): `'rasch'` or `'2pl'`.
+
+    Returns:
+    - dict: The result of `fit_irt` per cohort name.
+    """
+    return {name: fit_irt(response_matrix(data, variant), model) for name, data in cohorts.items()}
+
+
+def main():
+    cohorts = {'2023': read_tsv('csv/resultater23.tsv'), '2024': read_tsv('csv/resultater24.tsv')}
+    for variant in ['proc', 'virt']:
+        for model in MODELS:
+            fits = cohort_irt(cohorts, variant, model)
+            print(f'\n{model} {variant}')
+            print(pd.concat({name: fit['items'] for name, fit in fits.items()}, axis=1).round(2).to_string())
+            for name, fit in fits.items():
+                abilities = fit['abilities']['ability']
+                print(f'{name}: mean ability {abilities.mean():.2f}, sd {abilities.std():.2f}, '
+                      f'log-likelihood {fit["log_likelihood"]:.2f}, {fit["iterations"]} iterations'
+                      f'{"" if fit["converged"] else " (not converged)"}')
+
+
+if __name__ == "__main__":
+    main()
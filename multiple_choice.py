@@ -3,37 +3,49 @@ import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 
-from utils import adjust_labels
+from patterns import answer_patterns
+from profiling import profiled
+from schema import question_schema
+from utils import adjust_labels, read_tsv
 
 
+@profiled
 def correct_answers(data, postpend='_proc'):
-    correct_answers = data.loc['correct_answers', f'q1{postpend}':f'q5{postpend}']
-    candidates_answers = data.loc['0':, f'q1{postpend}':f'q5{postpend}']
-
-    num_correct = [0 for _ in range(6)]
-    # iterate over the candidate_answers
-    for _, row in candidates_answers.iterrows():
-        counter = sum(answer == correct for answer, correct in zip(row, correct_answers))
-        num_correct[counter] += 1
-
-    return num_correct
+    schema = question_schema(data)
+    positions = schema.positions('q', postpend)
+    patterns = answer_patterns(data, positions)
+    return patterns.histogram(patterns.correct(schema.correct[positions]).sum(axis=1), minlength=6).tolist()
 
+@profiled
 def plot_bar(num_correct):
     sns.set(style="whitegrid")
     sns.barplot(x=[0, 1, 2, 3, 4, 5], y=num_correct, legend=False)
     plt.show()
 
 
-def bar_graph_general(data, question, title, postpend=''):
-    answers = data.loc['0':, f'{question}{postpend}']
-    alternatives = data.loc['answers', f'{question}{postpend}'].split(', ')
+def _position(schema, question, postpend):
+    # A full column name, or a topic and its variant, e.g. ('andre_ressurser', '_virt')
+    return schema.position(question, postpend) if postpend else schema.index[question]
+
 
-    answers_lists = answers.apply(lambda x: [int(i) for i in x.split(',') if i.isdigit()])
+def _choices(data, schema, position):
+    """
+    Returns:
+    - list: Every chosen option index of a column, several per participant for multi-select columns.
+    """
+    if not schema.multi_select[position]:
+        return schema.answers(position).dropna().astype(int).tolist()
+    answers = data.loc[schema.participants].iloc[:, position].dropna().astype(str)
+    return [int(i) for answer in answers for i in answer.split(',') if i.isdigit()]
 
-    # concat all the answers_list into one list as a list comprehension
-    all_answers = [answer for answers_list in answers_lists for answer in answers_list]
 
-    frequencies = Counter(all_answers)
+@profiled
+def bar_graph_general(data, question, title, postpend=''):
+    schema = question_schema(data)
+    position = _position(schema, question, postpend)
+    alternatives = schema.options[position]
+
+    frequencies = Counter(_choices(data, schema, position))
 
     frequencies_df = pd.DataFrame(frequencies.items(), columns=['Choice', 'Frequency'])
     frequencies_df['Choice'] = frequencies_df['Choice'].apply(lambda x: alternatives[x])
@@ -64,19 +76,15 @@ def bar_graph_general(data, question, title, postpend=''):
     plt.show()
 
 
+@profiled
 def bar_graph_general_gpt(data, question, title, postpend=''):
-    answers = data.loc['0':, f'{question}{postpend}']
-    alternatives = data.loc['answers', f'{question}{postpend}'].split(', ')
+    schema = question_schema(data)
+    position = _position(schema, question, postpend)
 
     # Adjust the alternatives for better readability
-    adjusted_alternatives = adjust_labels(alternatives)
-
-    answers_lists = answers.apply(lambda x: [int(i) for i in x.split(',') if i.isdigit()])
-
-    # Concat all the answers_list into one list as a list comprehension
-    all_answers = [answer for answers_list in answers_lists for answer in answers_list]
+    adjusted_alternatives = adjust_labels(schema.options[position])
 
-    frequencies = Counter(all_answers)
+    frequencies = Counter(_choices(data, schema, position))
 
     frequencies_df = pd.DataFrame(frequencies.items(), columns=['Choice', 'Frequency'])
 
@@ -122,6 +130,7 @@ def bar_graph_general_gpt(data, question, title, postpend=''):
     plt.show()
 
 
+@profiled
 def compare_bar_graph(last_year, this_year):
     last_year = [(x / sum(last_year)) * 100 for x in last_year]
     this_year = [(x / sum(this_year)) * 100 for x in this_year]
@@ -147,13 +156,13 @@ def compare_bar_graph(last_year, this_year):
 
 def main():
     data_path = 'csv/resultater24.tsv'  # Replace with the correct path to your data file
-    data = pd.read_csv(data_path, delimiter='\t', index_col=0)
+    data = read_tsv(data_path, pattern=('q?_proc', 'q?_virt'))
 
     virt_24 = correct_answers(data, postpend='_virt')
     proc_24 = correct_answers(data, postpend='_proc')
 
     data_path = 'csv/resultater23.tsv'
-    data = pd.read_csv(data_path, delimiter='\t', index_col=0)
+    data = read_tsv(data_path, pattern=('q?_proc', 'q?_virt'))
     virt_23 = correct_answers(data, postpend='_virt')
     proc_23 = correct_answers(data, postpend='_proc')
     compare_bar_graph(virt_23.copy(), virt_24.copy())
@@ -0,0 +1,271 @@
+import glob
+import io
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+from exam_22 import POINTS, TRIES, TRIM, average_score
+from profiling import profiled
+from quantiles import KLLSketch, percentile_summary, trim_cutoffs
+from schema import MULTI_SELECT
+from utils import time_to_seconds
+
+# Number of metadata rows (questions, answers, correct_answers) between the header and the participants
+METADATA_ROWS = 3
+
+
+def _add(counts, name, values):
+    previous = counts.get(name)
+    if previous is None:
+        counts[name] = values
+        return
+    if isinstance(previous, KLLSketch):
+        counts[name] = previous.merge(values)
+        return
+    if len(previous) < len(values):
+        previous, values = values, previous
+    previous = previous.copy()
+    previous[:len(values)] += values
+    counts[name] = previous
+
+
+def merge_partials(first, second):
+    """
+    Merges two partial aggregates by adding up their counts, histograms and moment sums and merging their
+    quantile sketches.
+
+    Parameters:
+    - first (dict): A partial aggregate.
+    - second (dict): Another partial aggregate.
+
+    Returns:
+    - dict: The combined partial aggregate.
+    """
+    merged = {section: dict(values) for section, values in first.items()}
+    for section, values in second.items():
+        target = merged.setdefault(section, {})
+        for name, array in values.items():
+            _add(target, name, array)
+    return merged
+
+
+def _moment_sums(values):
+    values = values[~np.isnan(values)]
+    return np.array([values.size, values.sum(), (values ** 2).sum(), (values ** 3).sum()])
+
+
+def score_chunk(chunk, correct_answers, seed=None):
+    """
+    Aggregates the answers of one chunk of survey participants.
+
+    Parameters:
+    - chunk (DataFrame): Participant rows of a survey export, as strings.
+    - correct_answers (Series): The `correct_answers` row of the same export.
+    - seed (int): The seed of the completion time sketch.
+
+    Returns:
+    - dict: The partial aggregate with answer option `counts` and `moments` (count, sum, sum of squares, sum of
+      cubes) per question, the q1-q5 score histogram per topic in `scores` and a quantile sketch of the
+      completion time in `sketches`.
+    """
+    partial = {'counts': {}, 'moments': {}, 'scores': {}, 'sketches': {}}
+    for question in chunk.columns:
+        answers = chunk[question]
+        if question == 'tid':
+            seconds = time_to_seconds(answers).to_numpy()
+            partial['moments'][question] = _moment_sums(seconds)
+            partial['sketches'][question] = KLLSketch(seed=seed).update(seconds)
+            continue
+        if question in MULTI_SELECT:
+            answers = answers.str.split(',').explode()
+        codes = pd.to_numeric(answers, errors='coerce').to_numpy(dtype=float)
+        partial['moments'][question] = _moment_sums(codes)
+        codes = codes[~np.isnan(codes)].astype(int)
+        partial['counts'][question] = np.bincount(codes[codes >= 0]).astype(float)
+    for topic in ['proc', 'virt']:
+        columns = [f'q{i}_{topic}' for i in range(1, 6)]
+        if not set(columns).issubset(chunk.columns):
+            continue
+        answered = chunk[columns].apply(pd.to_numeric, errors='coerce').to_numpy()
+        correct = pd.to_numeric(correct_answers[columns]).to_numpy()
+        partial['scores'][topic] = np.bincount((answered == correct).sum(axis=1), minlength=6).astype(float)
+    return partial
+
+
+def _survey_partitions(path, chunk_rows):
+    """
+    Splits a survey export into tasks of at most `chunk_rows` participants, found by a single streaming pass
+    over the line offsets so no participant data is parsed here.
+    """
+    metadata = pd.read_csv(path, delimiter='\t', index_col=0, dtype=str, nrows=METADATA_ROWS)
+    correct_answers = metadata.loc['correct_answers']
+    with open(path, 'rb') as file:
+        header = file.readline()
+        for _ in range(METADATA_ROWS):
+            file.readline()
+        offset, num_lines = file.tell(), 0
+        while file.readline():
+            num_lines += 1
+            if num_lines == chunk_rows:
+                yield path, header, offset, num_lines, correct_answers
+                offset, num_lines = file.tell(), 0
+        if num_lines:
+            yield path, header, offset, num_lines, correct_answers
+
+
+def _survey_partial(path, header, offset, num_lines, correct_answers):
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        lines = b''.join(file.readline() for _ in range(num_lines))
+    chunk = pd.read_csv(io.BytesIO(header + lines), delimiter='\t', index_col=0, dtype=str)
+    return score_chunk(chunk, correct_answers, seed=offset)
+
+
+def _exam_partitions(path, chunk_columns):
+    with open(path, 'r') as file:
+        num_columns = file.readline().count('\t') + 1
+    for start in range(1, num_columns, chunk_columns):
+        yield path, start, min(start + chunk_columns, num_columns)
+
+
+def _exam_partial(path, start, end):
+    """
+    Aggregates the exam scores of the participants in columns `start` to `end`, the partial equivalent of
+    `exam_22.calculate_scores` without filtering.
+    """
+    data = pd.read_csv(path, delimiter='\t', index_col=0, decimal=',', usecols=[0, *range(start, end)])
+    data = data.astype(float)
+    tasks = data.drop(index='sum', errors='ignore')
+    totals = tasks.groupby(tasks.index.str[:-2], sort=False).sum().to_numpy()
+    attempted = totals > 0
+    categories = tasks.index.str[:-2].unique()
+    partial = {
+        'tries': {category: np.array([count]) for category, count in zip(categories, attempted.sum(axis=1))},
+        'points': {category: np.array([points]) for category, points in
+                   zip(categories, np.where(attempted, totals, 0).sum(axis=1))},
+        'moments': {},
+        'sketches': {},
+    }
+    if 'sum' in data.index:
+        partial['moments']['sum'] = _moment_sums(data.loc['sum'].to_numpy())
+        partial['sketches']['sum'] = KLLSketch(seed=start).update(data.loc['sum'].to_numpy())
+    return partial
+
+
+def _run(function, tasks, processes):
+    tasks = list(tasks)
+    if not tasks:
+        raise ValueError('No data to aggregate')
+    if processes is None:
+        partials = (function(*task) for task in tasks)
+        return reduce(merge_partials, partials)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return reduce(merge_partials, executor.map(function, *zip(*tasks)))
+
+
+@profiled
+def aggregate_surveys(paths, chunk_rows=10_000, processes=None):
+    """
+    Aggregates any number of survey exports chunk by chunk, so memory is bounded by the chunk size.
+
+    Parameters:
+    - paths (iterable): Paths to `resultater*.tsv` exports, the responses of all files are pooled.
+    - chunk_rows (int): The number of participants per chunk.
+    - processes (int): The number of worker processes, or None to run in this process.
+
+    Returns:
+    - dict: The merged partial aggregate, see `score_chunk`. Use `survey_summary` for distributions and moments.
+    """
+    tasks = (task for path in paths for task in _survey_partitions(path, chunk_rows))
+    return _run(_survey_partial, tasks, processes)
+
+
+@profiled
+def aggregate_exams(paths, chunk_columns=10_000, processes=None):
+    """
+    Aggregates any number of exam exports in chunks of participant columns.
+
+    Parameters:
+    - paths (iterable): Paths to `exam_results_*.tsv` exports, the participants of all files are pooled.
+    - chunk_columns (int): The number of participants per chunk.
+    - processes (int): The number of worker processes, or None to run in this process.
+
+    Returns:
+    - dict: The merged partial aggregate with `tries` and `points` per category and `moments` and a quantile
+      sketch (`sketches`) of the exam sum.
+    """
+    tasks = (task for path in paths for task in _exam_partitions(path, chunk_columns))
+    return _run(_exam_partial, tasks, processes)
+
+
+def moments_from_sums(sums):
+    """
+    Turns moment sums into the count, mean, standard deviation and skewness reported in the LaTeX tables.
+
+    The standard deviation and skewness use the same bias corrections as pandas' `std` and `skew`.
+
+    Parameters:
+    - sums (ndarray): The count, sum, sum of squares and sum of cubes of the values.
+
+    Returns:
+    - dict: The `count`, `mean`, `std` and `skew`.
+    """
+    n, s1, s2, s3 = sums
+    mean = s1 / n if n else np.nan
+    m2 = s2 / n - mean ** 2 if n else np.nan
+    m3 = s3 / n - 3 * mean * s2 / n + 2 * mean ** 3 if n else np.nan
+    std = np.sqrt(m2 * n / (n - 1)) if n > 1 else np.nan
+    if n > 2 and m2 > 1e-14 * max(1.0, mean ** 2):
+        skew = np.sqrt(n * (n - 1)) / (n - 2) * m3 / m2 ** 1.5
+    else:
+        skew = 0.0 if n > 2 else np.nan
+    return {'count': int(n), 'mean': mean, 'std': std, 'skew': skew}
+
+
+def survey_summary(partial):
+    """
+    Returns:
+    - dict: A DataFrame of percentage `distributions` (questions as rows, answer options as columns), a
+      DataFrame of `moments` per question, a DataFrame of q1-q5 `scores` percentages per topic and the
+      approximate percentiles of the `completion_time` in seconds.
+    """
+    distributions = pd.DataFrame({question: pd.Series(counts / counts.sum() * 100)
+                                  for question, counts in partial['counts'].items()}).T.fillna(0)
+    moments = pd.DataFrame({question: moments_from_sums(sums) for question, sums in partial['moments'].items()}).T
+    scores = pd.DataFrame({topic: counts / counts.sum() * 100 for topic, counts in partial['scores'].items()})
+    sketches = partial.get('sketches', {})
+    completion_time = percentile_summary(sketches['tid']) if 'tid' in sketches else None
+    return {'distributions': distributions, 'moments': moments, 'scores': scores, 'completion_time': completion_time}
+
+
+def exam_summary(partial):
+    """
+    Returns:
+    - dict: `[TRIES, POINTS]` per category, the same layout as `exam_22.calculate_scores`.
+    """
+    res_dict = {}
+    for category in partial['tries']:
+        res_dict[category] = [0, 0]
+        res_dict[category][TRIES] = int(partial['tries'][category][0])
+        res_dict[category][POINTS] = float(partial['points'][category][0])
+    return res_dict
+
+
+def main():
+    surveys = survey_summary(aggregate_surveys(sorted(glob.glob('csv/resultater*.tsv')), chunk_rows=20,
+                                               processes=4))
+    print(surveys['moments'].round(2).to_string())
+    print(surveys['scores'].round(2).to_string())
+    print(surveys['completion_time'].round(1).to_string())
+
+    exams = aggregate_exams(sorted(glob.glob('csv/exam_results_????.tsv')), chunk_columns=50, processes=4)
+    print(average_score(exam_summary(exams)))
+    print(moments_from_sums(exams['moments']['sum']))
+    print(percentile_summary(exams['sketches']['sum']).round(2).to_string())
+    print('Trim cutoffs:', trim_cutoffs(exams['sketches']['sum'], TRIM))
+
+
+if __name__ == "__main__":
+    main()
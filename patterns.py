@@ -0,0 +1,137 @@
+import numpy as np
+from scipy.stats import ttest_ind_from_stats
+
+from profiling import profiled
+from schema import question_schema
+from utils import cached_per_frame
+
+# Answer codes are packed into one byte each, with 0 for a missing answer
+MAX_CODE = 254
+
+
+class AnswerPatterns:
+    """
+    The distinct answer patterns of a participants x questions matrix and how many participants gave each.
+
+    With five questions per topic the patterns repeat heavily, so scoring, histograms, moments and t-tests run
+    on the unique patterns weighted by their counts instead of on every participant. `expand` maps per-pattern
+    results back to participants in their original order.
+    """
+
+    def __init__(self, codes):
+        codes = np.asarray(codes, dtype=float)
+        if codes.ndim != 2:
+            raise ValueError(f'Expected a participants x questions matrix, got shape {codes.shape}')
+        observed = codes[~np.isnan(codes)]
+        if observed.size and (observed.min() < 0 or observed.max() > MAX_CODE or (observed % 1).any()):
+            raise ValueError(f'Answer codes must be integers between 0 and {MAX_CODE}')
+        packed = np.ascontiguousarray(np.where(np.isnan(codes), 0, codes + 1).astype(np.uint8))
+        if packed.shape[1] <= 8:
+            # Up to eight questions fit in one integer key, which np.unique sorts much faster than bytes
+            keys = packed @ (np.uint64(256) ** np.arange(packed.shape[1], dtype=np.uint64))
+        else:
+            keys = packed.view(np.dtype((np.void, packed.shape[1]))).ravel()
+        _, first, self.inverse, self.counts = np.unique(keys, return_index=True, return_inverse=True,
+                                                        return_counts=True)
+        self.inverse = self.inverse.ravel()
+        self.patterns = codes[first]
+        self.size = len(codes)
+
+    def expand(self, values):
+        """
+        Returns:
+        - ndarray: Per-pattern values repeated for every participant, in the original participant order.
+        """
+        return np.asarray(values)[self.inverse]
+
+    def correct(self, correct_answers):
+        """
+        Returns:
+        - ndarray: A patterns x questions boolean array, True where the pattern has the correct answer.
+        """
+        return self.patterns == np.asarray(correct_answers, dtype=float)
+
+    def histogram(self, values, minlength=0):
+        """
+        Counts the participants per integer value, e.g. per number of correct answers.
+
+        Parameters:
+        - values (ndarray): One non-negative integer per pattern.
+        - minlength (int): The minimum number of bins.
+
+        Returns:
+        - ndarray: The number of participants with each value.
+        """
+        return np.bincount(values, weights=self.counts, minlength=minlength).astype(int)
+
+    def moments(self, values):
+        """
+        Parameters:
+        - values (ndarray): One value per pattern, NaN values are left out.
+
+        Returns:
+        - dict: The participant-weighted `count`, `mean`, `std` and `skew`, as pandas computes them, and the
+          population variance `var`.
+        """
+        values = np.asarray(values, dtype=float)
+        observed = ~np.isnan(values)
+        values, counts = values[observed], self.counts[observed]
+        n = counts.sum()
+        if n == 0:
+            return {'count': 0, 'mean': np.nan, 'std': np.nan, 'skew': np.nan, 'var': np.nan}
+        # Two passes over the deviations, as pandas and numpy do, rather than sums of powers
+        mean = counts @ values / n
+        deviations = values - mean
+        m2 = counts @ deviations ** 2 / n
+        m3 = counts @ deviations ** 3 / n
+        std = np.sqrt(m2 * n / (n - 1)) if n > 1 else np.nan
+        if n > 2 and m2 > 1e-14 * max(1.0, mean ** 2):
+            skew = np.sqrt(n * (n - 1)) / (n - 2) * m3 / m2 ** 1.5
+        else:
+            skew = 0.0 if n > 2 else np.nan
+        return {'count': int(n), 'mean': mean, 'std': std, 'skew': skew, 'var': m2}
+
+
+@profiled
+def weighted_t_test(values_1, patterns_1, values_2, patterns_2, equal_var=True):
+    """
+    Performs the two-sample t-test on per-pattern values weighted by the pattern counts, giving the result of
+    `scipy.stats.ttest_ind` on the expanded per-participant values up to floating-point rounding.
+
+    Parameters:
+    - values_1 (ndarray): One value per pattern of the first sample, e.g. the share of correct answers.
+    - patterns_1 (AnswerPatterns): The patterns of the first sample.
+    - values_2 (ndarray): One value per pattern of the second sample.
+    - patterns_2 (AnswerPatterns): The patterns of the second sample.
+    - equal_var (bool): Whether to assume equal variances (Student) or not (Welch).
+
+    Returns:
+    - tuple: The T-statistic and the p-value.
+    """
+    first, second = patterns_1.moments(values_1), patterns_2.moments(values_2)
+    result = ttest_ind_from_stats(first['mean'], first['std'], first['count'], second['mean'], second['std'],
+                                  second['count'], equal_var=equal_var)
+    return result.statistic, result.pvalue
+
+
+@cached_per_frame
+def _pattern_cache(data):
+    return {}
+
+
+def answer_patterns(data, positions):
+    """
+    Returns the answer patterns of some questions of a loaded cohort, compressed once and cached with the frame.
+
+    Parameters:
+    - data (DataFrame): A loaded cohort.
+    - positions (ndarray): The positions of the questions, e.g. `question_schema(data).positions('q', 'proc')`.
+
+    Returns:
+    - AnswerPatterns: The patterns of all participants of the cohort.
+    """
+    cache = _pattern_cache(data)
+    key = tuple(int(position) for position in positions)
+    if key not in cache:
+        cache[key] = AnswerPatterns(question_schema(data).codes[:, list(key)])
+    return cache[key]
@@ -0,0 +1,49 @@
+import matplotlib.pyplot as plt
+
+import exam_22
+import results_chapter
+from figures import PLOT_DIR, collect
+
+# The per-category CSVs of the results chapter
+CHAPTER_CATEGORIES = [('./csv/mcqs_processes.csv', 'processes'), ('./csv/mcqs_virtual.csv', 'virtual')]
+
+
+def build_chapter(path=f'{PLOT_DIR}/results_chapter.pdf', categories=None):
+    """
+    Collects one faceted bar graph per category of the results chapter into a PDF.
+
+    Parameters:
+    - path (str): The path of the PDF.
+    - categories (list): `(csv_path, category)` pairs, defaults to `CHAPTER_CATEGORIES`.
+
+    Returns:
+    - list: The names of the saved figures, one per page.
+    """
+    categories = CHAPTER_CATEGORIES if categories is None else categories
+    with collect(path) as saved:
+        for csv_path, category in categories:
+            results_chapter.plot_bar_graph(results_chapter.load_and_normalize_data(csv_path), category, faceted=True)
+            plt.close('all')
+    return saved
+
+
+def build_exam(path=f'{PLOT_DIR}/exam_results.pdf'):
+    """
+    Collects the average scores and attempts of `exam_22.main`, each filtered and unfiltered, into a PDF.
+
+    Returns:
+    - list: The names of the saved figures, one per page.
+    """
+    with collect(path) as saved:
+        exam_22.main()
+        plt.close('all')
+    return saved
+
+
+def main():
+    for saved in [build_chapter(), build_exam()]:
+        print(f"{len(saved)} pages: {', '.join(saved)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import brentq
+from scipy.stats import f_oneway, ttest_ind
+
+from multiple_choice import correct_answers
+from profiling import profiled
+from utils import read_tsv
+
+# Upper bound on the number of simulated scores held in memory by one batch
+MAX_BATCH_VALUES = 2_000_000
+
+
+def score_distribution(num_correct):
+    """
+    Turns the score counts from `multiple_choice.correct_answers` into probabilities.
+
+    Parameters:
+    - num_correct (list): The number of participants with 0, 1, ..., 5 correct answers.
+
+    Returns:
+    - ndarray: The probability of each score.
+    """
+    counts = np.asarray(num_correct, dtype=float)
+    return counts / counts.sum()
+
+
+def tilt_distribution(distribution, mean_difference):
+    """
+    Shifts the mean of a score distribution while keeping its shape as close as possible.
+
+    The probabilities are exponentially tilted, p_i * exp(theta * i), with theta chosen so that the mean score
+    changes by `mean_difference`. This gives a realistic alternative cohort for "what if the new cohort scored
+    half a point higher" questions, without producing scores outside 0..5.
+
+    Parameters:
+    - distribution (ndarray): The probability of each score.
+    - mean_difference (float): The wanted change in mean score.
+
+    Returns:
+    - ndarray: The tilted probability of each score.
+    """
+    distribution = np.asarray(distribution, dtype=float)
+    scores = np.arange(len(distribution))
+    target = scores @ distribution + mean_difference
+    if not scores[distribution > 0].min() < target < scores[distribution > 0].max():
+        raise ValueError(f'A mean score of {target:.2f} cannot be reached from this distribution')
+
+    def tilted(theta):
+        weights = distribution * np.exp(theta * (scores - scores.mean()))
+        return weights / weights.sum()
+
+    theta = brentq(lambda theta: scores @ tilted(theta) - target, -50, 50)
+    return tilted(theta)
+
+
+def simulate_scores(distribution, num_cohorts, sample_size, rng):
+    """
+    Draws synthetic cohorts from a score distribution.
+
+    Parameters:
+    - distribution (ndarray): The probability of each score.
+    - num_cohorts (int): The number of cohorts to draw.
+    - sample_size (int): The number of participants in each cohort.
+    - rng (Generator): The NumPy random generator to draw from.
+
+    Returns:
+    - ndarray: A (num_cohorts, sample_size) array of scores.
+    """
+    cumulative = np.cumsum(distribution)
+    scores = np.searchsorted(cumulative, rng.random((num_cohorts, sample_size)) * cumulative[-1], side='right')
+    return np.minimum(scores, len(distribution) - 1)
+
+
+def _rejection_rate(distributions, sample_size, num_simulations, alpha, seed):
+    """
+    Simulates `num_simulations` studies and returns the fraction where the test rejects the null hypothesis.
+
+    Two distributions are compared with the same pooled-variance t-test as `patterns.weighted_t_test`, more than two
+    with the one-way ANOVA used in `anova_exam22.main`. Each batch runs every simulated study at once by testing
+    along the rows of the simulated score matrices.
+    """
+    rng = np.random.default_rng(seed)
+    batch_size = max(1, MAX_BATCH_VALUES // (sample_size * len(distributions)))
+    rejections = 0
+    for start in range(0, num_simulations, batch_size):
+        num_cohorts = min(batch_size, num_simulations - start)
+        groups = [simulate_scores(distribution, num_cohorts, sample_size, rng) for distribution in distributions]
+        if len(groups) == 2:
+            _, p_values = ttest_ind(groups[0], groups[1], axis=1, equal_var=True)
+        else:
+            _, p_values = f_oneway(*groups, axis=1)
+        # Cohorts without any variance give NaN p-values, these never reject
+        rejections += np.count_nonzero(p_values < alpha)
+    return rejections / num_simulations
+
+
+@profiled
+def power_curve(distributions, sample_sizes, num_simulations=5000, alpha=0.05, seed=None, processes=None):
+    """
+    Estimates the power of the cohort comparison for a range of sample sizes with Monte Carlo simulation.
+
+    Parameters:
+    - distributions (list): The score distribution of each cohort, two for a t-test or more for an ANOVA.
+    - sample_sizes (iterable): The number of participants per cohort to evaluate.
+    - num_simulations (int): The number of simulated studies per sample size.
+    - alpha (float): The significance level of the test.
+    - seed (int): Seed for reproducible results, independent of the number of processes.
+    - processes (int): The number of worker processes, or None to run in this process.
+
+    Returns:
+    - Series: The estimated power, indexed by sample size.
+    """
+    if len(distributions) < 2:
+        raise ValueError('At least two score distributions are needed for a comparison')
+    sample_sizes = list(sample_sizes)
+    seeds = np.random.SeedSequence(seed).spawn(len(sample_sizes))
+    arguments = [(distributions, sample_size, num_simulations, alpha, sample_seed)
+                 for sample_size, sample_seed in zip(sample_sizes, seeds)]
+    if processes is None:
+        power = [_rejection_rate(*argument) for argument in arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            power = list(executor.map(_rejection_rate, *zip(*arguments)))
+    return pd.Series(power, index=pd.Index(sample_sizes, name='sample_size'), name='power')
+
+
+def required_sample_size(curve, target_power=0.8):
+    """
+    Finds the smallest evaluated sample size that reaches the target power.
+
+    Parameters:
+    - curve (Series): A power curve from `power_curve`.
+    - target_power (float): The wanted power.
+
+    Returns:
+    - int: The smallest sample size with at least the target power, or None if no sample size reaches it.
+    """
+    reached = curve[curve >= target_power]
+    return None if reached.empty else int(reached.index[0])
+
+
+def main():
+    data_24 = read_tsv('csv/resultater24.tsv', pattern=('q?_proc', 'q?_virt'))
+    data_23 = read_tsv('csv/resultater23.tsv', pattern=('q?_proc', 'q?_virt'))
+    sample_sizes = range(10, 301, 10)
+
+    for postpend in ['_proc', '_virt']:
+        dist_23 = score_distribution(correct_answers(data_23, postpend=postpend))
+        dist_24 = score_distribution(correct_answers(data_24, postpend=postpend))
+        curve = power_curve([dist_23, dist_24], sample_sizes, seed=2024, processes=4)
+        print(f'Power to detect the observed 2023/2024 difference{postpend}:')
+        print(curve.to_string())
+        print(f'Participants per cohort for 80% power: {required_sample_size(curve)}\n')
+
+        curve = power_curve([dist_24, tilt_distribution(dist_24, 0.5)], sample_sizes, seed=2024, processes=4)
+        print(f'Participants per cohort to detect +0.5 points{postpend} with 80% power: '
+              f'{required_sample_size(curve)}\n')
+
+
+if __name__ == "__main__":
+    main()
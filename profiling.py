@@ -0,0 +1,157 @@
+import atexit
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+# Set to a file path to profile a run, e.g. MASTER_PLOT_PROFILE=profile.json python exam_22.py
+PROFILE_ENV = 'MASTER_PLOT_PROFILE'
+
+_enabled = False
+_spans = []
+_stack = []
+
+
+def enable(output_path=None):
+    """
+    Starts recording spans. Until this is called, `span` and `profiled` do nothing.
+
+    Parameters:
+    - output_path (str): Where to write the JSON profile when the program exits, or None to only keep the spans
+      in memory.
+    """
+    global _enabled
+    if _enabled:
+        return
+    _enabled = True
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if output_path is not None:
+        atexit.register(_report, output_path, os.getpid())
+
+
+def disable():
+    """
+    Stops recording spans. Recorded spans are kept until `reset` is called.
+    """
+    global _enabled
+    _enabled = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def reset():
+    """
+    Forgets all recorded spans.
+    """
+    _spans.clear()
+
+
+@contextmanager
+def span(name):
+    """
+    Records the wall time, CPU time and peak traced memory of the enclosed block.
+
+    Spans can be nested, the memory peak of a span includes the peaks of the spans inside it.
+
+    Parameters:
+    - name (str): The name of the span in the profile, e.g. `'anova_exam22.f_oneway'`.
+    """
+    if not _enabled:
+        yield
+        return
+    if _stack:
+        _stack[-1]['peak'] = max(_stack[-1]['peak'], tracemalloc.get_traced_memory()[1])
+    tracemalloc.reset_peak()
+    entry = {'start': tracemalloc.get_traced_memory()[0], 'peak': 0}
+    _stack.append(entry)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        peak = max(tracemalloc.get_traced_memory()[1], entry['peak'])
+        _stack.pop()
+        if _stack:
+            _stack[-1]['peak'] = max(_stack[-1]['peak'], peak)
+        _spans.append({
+            'name': name,
+            'depth': len(_stack),
+            'wall_s': wall,
+            'cpu_s': cpu,
+            'peak_bytes': peak - entry['start'],
+        })
+
+
+def profiled(func):
+    """
+    Decorator recording every call of the function as a span named `<module>.<function>`.
+    """
+    name = f'{func.__module__}.{func.__qualname__}'
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+        with span(name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def summary_table():
+    """
+    Aggregates the recorded spans per name.
+
+    Returns:
+    - DataFrame: The number of calls, total and mean wall time, total CPU time and largest memory peak of each
+      span, sorted by total wall time.
+    """
+    spans = pd.DataFrame(_spans, columns=['name', 'depth', 'wall_s', 'cpu_s', 'peak_bytes'])
+    summary = spans.groupby('name').agg(
+        calls=('wall_s', 'size'),
+        wall_s=('wall_s', 'sum'),
+        mean_wall_s=('wall_s', 'mean'),
+        cpu_s=('cpu_s', 'sum'),
+        peak_mib=('peak_bytes', 'max'),
+    )
+    summary['peak_mib'] = summary['peak_mib'] / 2 ** 20
+    return summary.sort_values('wall_s', ascending=False)
+
+
+def write_profile(path):
+    """
+    Writes the recorded spans and their summary to a JSON file.
+
+    Parameters:
+    - path (str): The path of the JSON file.
+    """
+    profile = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'argv': sys.argv,
+        'spans': _spans,
+        'summary': summary_table().reset_index().to_dict(orient='records'),
+    }
+    with open(path, 'w') as file:
+        json.dump(profile, file, indent=2)
+
+
+def _report(path, pid):
+    # Worker processes inherit the environment variable, only the process that enabled profiling reports
+    if os.getpid() != pid or not _spans:
+        return
+    write_profile(path)
+    print(f'\nProfile written to {path}', file=sys.stderr)
+    print(summary_table().round(4).to_string(), file=sys.stderr)
+
+
+if os.environ.get(PROFILE_ENV):
+    enable(os.environ[PROFILE_ENV])
@@ -0,0 +1,221 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+# Capacity of a compactor relative to the one above it
+CAPACITY_DECAY = 2 / 3
+
+# Percentiles reported by `percentile_summary`
+REPORT_PERCENTILES = [5, 25, 50, 75, 95]
+
+
+class KLLSketch:
+    """
+    A mergeable quantile sketch (Karnin, Lang and Liberty, 2016) in constant memory.
+
+    Values go into a stack of compactors. When a compactor is full it is sorted and every other value, starting
+    at a random offset, is promoted to the next compactor with twice the weight. Sketches built on separate
+    chunks or files merge into one that answers quantiles for all the data. With the default `k` of 200 the
+    rank error is about 1% of the number of values, with about 3k values kept however many are added.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(2, int(np.ceil(self.k * CAPACITY_DECAY ** depth)))
+
+    def _compress(self):
+        while True:
+            full = [level for level in range(len(self.levels)) if self.levels[level].size > self._capacity(level)]
+            if not full:
+                return
+            level = full[0]
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            values = np.sort(self.levels[level])
+            # An odd value out stays behind so only pairs are halved
+            odd = values.size % 2
+            promoted = values[odd + self._rng.integers(2)::2]
+            self.levels[level] = values[:odd]
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+
+    def update(self, values):
+        """
+        Adds values to the sketch, NaN values are ignored.
+
+        Parameters:
+        - values (array-like): The values to add.
+
+        Returns:
+        - KLLSketch: The sketch itself.
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        self.count += values.size
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """
+        Combines two sketches without changing either. The merged sketch continues from a copy of this sketch's
+        random state, so merging the same sketches in the same order always gives the same result.
+
+        Parameters:
+        - other (KLLSketch): A sketch of other values.
+
+        Returns:
+        - KLLSketch: A sketch of the values of both.
+        """
+        merged = KLLSketch(max(self.k, other.k))
+        merged._rng = copy.deepcopy(self._rng)
+        num_levels = max(len(self.levels), len(other.levels))
+        merged.levels = [np.concatenate([sketch.levels[level] for sketch in (self, other)
+                                         if level < len(sketch.levels)]) for level in range(num_levels)]
+        merged.count = self.count + other.count
+        merged.min = min(self.min, other.min)
+        merged.max = max(self.max, other.max)
+        merged._compress()
+        return merged
+
+    def _sorted(self):
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(level.size, 2.0 ** height) for height, level in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        return values[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        """
+        Parameters:
+        - q (float or array-like): Quantiles between 0 and 1.
+
+        Returns:
+        - float or ndarray: The approximate value at each quantile, the exact minimum and maximum at 0 and 1, NaN
+          for an empty sketch.
+        """
+        q = np.asarray(q, dtype=float)
+        if self.count == 0:
+            return np.full(q.shape, np.nan) if q.ndim else np.nan
+        values, cumulative = self._sorted()
+        index = np.clip(np.searchsorted(cumulative, q * cumulative[-1], side='left'), 0, values.size - 1)
+        result = np.where(q <= 0, self.min, np.where(q >= 1, self.max, values[index]))
+        return result if q.ndim else float(result)
+
+    def at_rank(self, rank):
+        """
+        Parameters:
+        - rank (int or array-like): 1-based ranks in ascending order, 1 for the smallest value.
+
+        Returns:
+        - float or ndarray: The approximate value at each rank. The weights are powers of two adding up to `count`,
+          so the ranks are compared exactly.
+        """
+        rank = np.asarray(rank, dtype=float)
+        if self.count == 0:
+            return np.full(rank.shape, np.nan) if rank.ndim else np.nan
+        values, cumulative = self._sorted()
+        result = values[np.clip(np.searchsorted(cumulative, rank, side='left'), 0, values.size - 1)]
+        return result if rank.ndim else float(result)
+
+    def mad(self):
+        """
+        Returns:
+        - float: The approximate median absolute deviation from the median, taken from the weighted values of the
+          sketch, so it needs no second pass over the data and works on merged sketches.
+        """
+        if self.count == 0:
+            return np.nan
+        values, cumulative = self._sorted()
+        weights = np.diff(cumulative, prepend=0)
+        deviations = np.abs(values - self.quantile(0.5))
+        order = np.argsort(deviations, kind='stable')
+        index = np.searchsorted(np.cumsum(weights[order]), 0.5 * cumulative[-1], side='left')
+        return float(deviations[order][index])
+
+    def rank(self, value):
+        """
+        Returns:
+        - float: The approximate share of values less than or equal to `value`.
+        """
+        if self.count == 0:
+            return np.nan
+        values, cumulative = self._sorted()
+        below = np.searchsorted(values, value, side='right')
+        return cumulative[below - 1] / cumulative[-1] if below else 0.0
+
+
+def trim_cutoffs(sketch, trim):
+    """
+    Finds the first and the last value a sorted list of the sketched values keeps when cutting `trim` values
+    from each end.
+
+    Parameters:
+    - sketch (KLLSketch): A sketch of the values.
+    - trim (int): The number of values to cut from each end.
+
+    Returns:
+    - tuple: `(low, high)`, the values at ranks `trim + 1` and `count - trim`.
+    """
+    low, high = sketch.at_rank([trim + 1, sketch.count - trim])
+    return float(low), float(high)
+
+
+def trim_mask(values, sketch, trim):
+    """
+    Selects the values kept when cutting `trim` values from each end, with cutoffs from a sketch of the values.
+
+    Values strictly between the cutoffs are kept. Of the values tied with a cutoff, both ends keep as many as the
+    sketch ranks say lie inside the trim, in their original order, so ties neither add nor remove values at one
+    end only. With a sketch that kept every value this keeps exactly `count - 2 * trim` values, the same as the
+    exact trim up to which of several tied values are dropped.
+
+    Parameters:
+    - values (array-like): The values the sketch was built from, e.g. the exam sums of every participant.
+    - sketch (KLLSketch): A sketch of the values.
+    - trim (int): The number of values to cut from each end.
+
+    Returns:
+    - ndarray: One boolean per value, True for the kept values.
+    """
+    values = np.asarray(values, dtype=float)
+    low, high = trim_cutoffs(sketch, trim)
+    sketched, cumulative = sketch._sorted()
+
+    def count_below(value, side):
+        index = np.searchsorted(sketched, value, side=side)
+        return cumulative[index - 1] if index else 0
+
+    if low == high:
+        quotas = {low: sketch.count - 2 * trim}
+    else:
+        quotas = {low: count_below(low, 'right') - trim, high: sketch.count - trim - count_below(high, 'left')}
+    mask = (values > low) & (values < high)
+    for value, quota in quotas.items():
+        tied = np.flatnonzero(values == value)
+        mask[tied[:max(0, int(quota))]] = True
+    return mask
+
+
+def percentile_summary(sketch, percentiles=None):
+    """
+    Returns:
+    - Series: The count, minimum, approximate percentiles and maximum of the sketched values.
+    """
+    percentiles = REPORT_PERCENTILES if percentiles is None else percentiles
+    values = sketch.quantile(np.asarray(percentiles) / 100)
+    summary = {'count': sketch.count, 'min': sketch.min}
+    summary.update({f'p{percentile:g}': value for percentile, value in zip(percentiles, values)})
+    summary['max'] = sketch.max
+    return pd.Series(summary)
@@ -0,0 +1,341 @@
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import traceback
+import warnings
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import matplotlib
+
+# Figures are only rendered to memory, this has to happen before pyplot is imported by the modules below
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+
+import exam_22
+import multiple_choice
+import results_section
+from clustering import cluster_profiles, plot_centroids
+from profiling import profiled
+from schema import question_schema
+from screening import MASK_NAMES, screen
+from subgroups import subgroup_index
+from utils import plot_bargraph, read_tsv
+
+# Upper bound on the total size of the rendered figures and tables kept in the cache
+CACHE_BYTES = 64 * 2 ** 20
+
+SURVEY_PATH = 'csv/resultater{cohort}.tsv'
+EXAM_PATH = 'csv/exam_results_2022.tsv'
+
+# Matplotlib and the loaded frames are shared between request threads, so rendering is serialised
+_render_lock = threading.Lock()
+_hashes = {}
+_frames = {}
+
+
+class LRUCache:
+    """
+    Rendered responses bounded by their total size in bytes, evicting the least recently used first.
+    """
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns:
+        - tuple: The cached `(content_type, body)`, or None if the key is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        """
+        Caches a `(content_type, body)` response. Responses larger than the whole cache are not kept.
+        """
+        size = len(entry[1])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[1])
+            self._entries[key] = entry
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted[1])
+
+
+def file_hash(path):
+    """
+    Returns the SHA-256 of a data file, only reading the file again when its size or modification time changed.
+
+    Parameters:
+    - path (str): The path of the file.
+
+    Returns:
+    - str: The hex digest of the file contents.
+    """
+    stat = os.stat(path)
+    signature = (stat.st_size, stat.st_mtime_ns)
+    cached = _hashes.get(path)
+    if cached is None or cached[0] != signature:
+        with open(path, 'rb') as file:
+            cached = (signature, hashlib.sha256(file.read()).hexdigest())
+        _hashes[path] = cached
+    return cached[1]
+
+
+def _load(kind, path):
+    # Keeps one loaded frame per file and kind, replaced when the file contents change
+    digest = file_hash(path)
+    cached = _frames.get((kind, path))
+    if cached is not None and cached[0] == digest:
+        return cached[1]
+    if kind == 'survey':
+        data = results_section.load_data(path)
+    elif kind == 'raw':
+        data = read_tsv(path)
+    else:
+        data = read_tsv(path, decimal=',').astype(float)
+    _frames[(kind, path)] = (digest, data)
+    return data
+
+
+def _survey_path(cohort):
+    path = SURVEY_PATH.format(cohort=cohort)
+    if not os.path.exists(path):
+        raise KeyError(f'No survey for cohort {cohort}')
+    return path
+
+
+def cohorts():
+    """
+    Returns:
+    - list: The cohorts with a survey export, e.g. `['23', '24']`.
+    """
+    pattern = re.compile(re.escape(SURVEY_PATH).replace(r'\{cohort\}', r'(\d+)') + '$')
+    return sorted(match[1] for match in map(pattern.match, glob.glob(SURVEY_PATH.format(cohort='*'))) if match)
+
+
+def _screen(data, subgroup):
+    # Registers the speeder/straightliner/excluded masks the first time a subgroup uses them, e.g. ?subgroup=not
+    # excluded, so cohorts whose completion times cannot be screened still serve every other request
+    if not subgroup or not re.search(rf"\b({'|'.join(MASK_NAMES)})\b", subgroup):
+        return
+    if not set(MASK_NAMES) <= set(subgroup_index(data).names()):
+        screen(data)
+
+
+def _select(data, subgroup):
+    # The metadata rows and the participants of a subgroup, for plotting functions that read the raw layout
+    if not subgroup:
+        return data
+    _screen(data, subgroup)
+    participants = question_schema(data).participants
+    metadata = data.index[:len(data.index) - len(participants)]
+    return data.loc[[*metadata, *participants[subgroup_index(data).mask(subgroup)]]]
+
+
+def _capture(function, *args, **kwargs):
+    output = io.StringIO()
+    with redirect_stdout(output):
+        function(*args, **kwargs)
+    return output.getvalue().encode()
+
+
+def _figure(function, *args, **kwargs):
+    plt.close('all')
+    with warnings.catch_warnings(), redirect_stdout(io.StringIO()):
+        # The plotting functions end with plt.show(), which only warns with the Agg backend
+        warnings.simplefilter('ignore', category=UserWarning)
+        function(*args, **kwargs)
+    buffer = io.BytesIO()
+    plt.gcf().savefig(buffer, format='png', bbox_inches='tight')
+    plt.close('all')
+    return buffer.getvalue()
+
+
+def _index(match, query):
+    links = [f'<li><a href="/cohorts/{cohort}/questions">20{cohort} questions</a></li>' for cohort in cohorts()]
+    links += [f'<li><a href="/scores/{variant}.png">Scores {variant}</a></li>' for variant in ['proc', 'virt']]
+    links += ['<li><a href="/exam/averages.png">Exam averages</a></li>',
+              '<li><a href="/exam/clusters.png">Exam clusters</a></li>']
+    return 'text/html', f'<h1>Results</h1><ul>{"".join(links)}</ul>'.encode()
+
+
+def _questions(match, query):
+    schema = question_schema(_load('survey', _survey_path(match['cohort'])))
+    questions = [{'column': column, 'text': schema.texts[position], 'options': schema.options[position],
+                  'table': f'/cohorts/{match["cohort"]}/questions/{column}/table',
+                  'plot': f'/cohorts/{match["cohort"]}/questions/{column}/plot.png'}
+                 for position, column in enumerate(schema.columns) if schema.options[position]]
+    return 'application/json', json.dumps(questions, indent=2).encode()
+
+
+def _table(match, query):
+    data = _load('survey', _survey_path(match['cohort']))
+    position = question_schema(data).index[match['column']]
+    include_statistics = query.get('statistics', '1') != '0'
+    subgroup = query.get('subgroup') or None
+    _screen(data, subgroup)
+    return 'text/plain; charset=utf-8', _capture(results_section.question_table, data, position,
+                                                 f"20{match['cohort']} - group", include_statistics, True,
+                                                 subgroup=subgroup)
+
+
+def _plot(match, query):
+    data = _select(_load('raw', _survey_path(match['cohort'])), query.get('subgroup'))
+    schema = question_schema(data)
+    title = schema.texts[schema.index[match['column']]]
+    return 'image/png', _figure(multiple_choice.bar_graph_general_gpt, data, match['column'], title)
+
+
+def _scores(match, query):
+    before, after = query.get('before'), query.get('after')
+    if before is None or after is None:
+        before, after = cohorts()[-2:]
+    counts = [multiple_choice.correct_answers(_load('raw', _survey_path(cohort)), f"_{match['variant']}")
+              for cohort in [before, after]]
+    return 'image/png', _figure(multiple_choice.compare_bar_graph, *counts)
+
+
+def _exam_averages(match, query):
+    filtered = query.get('filtered', '0') != '0'
+    averages = exam_22.average_score(exam_22.calculate_scores(_load('exam', EXAM_PATH), filtered))
+    labels = [' '.join(key.split('_')).capitalize() for key in averages]
+    title = f"Exam results {'filtered' if filtered else 'unfiltered'}"
+    return 'image/png', _figure(plot_bargraph, "Avg scores", title, None, labels, list(averages.values()))
+
+
+def _exam_clusters(match, query):
+    _, centroids, _ = cluster_profiles(_load('exam', EXAM_PATH), seed=int(query.get('seed', 2022)))
+    return 'image/png', _figure(plot_centroids, centroids, save_name=None)
+
+
+def _survey_files(match, query):
+    if 'cohort' in match.groupdict():
+        return [_survey_path(match['cohort'])]
+    return [_survey_path(cohort) for cohort in cohorts()]
+
+
+# (path pattern, data files the response depends on, renderer)
+ROUTES = [
+    (r'/', lambda match, query: [], _index),
+    (r'/cohorts/(?P<cohort>\d+)/questions', _survey_files, _questions),
+    (r'/cohorts/(?P<cohort>\d+)/questions/(?P<column>\w+)/table', _survey_files, _table),
+    (r'/cohorts/(?P<cohort>\d+)/questions/(?P<column>\w+)/plot\.png', _survey_files, _plot),
+    (r'/scores/(?P<variant>proc|virt)\.png', _survey_files, _scores),
+    (r'/exam/averages\.png', lambda match, query: [EXAM_PATH], _exam_averages),
+    (r'/exam/clusters\.png', lambda match, query: [EXAM_PATH], _exam_clusters),
+]
+ROUTES = [(re.compile(pattern + '$'), files, render) for pattern, files, render in ROUTES]
+
+
+@profiled
+def respond(path, query, cache):
+    """
+    Renders the response for a request path, or serves it from the cache.
+
+    The cache key is the hash of every data file the response reads plus the path and query, so a response is
+    only rendered again when its data changed.
+
+    Parameters:
+    - path (str): The request path, e.g. `/cohorts/24/questions/tidseffektivt_proc/table`.
+    - query (dict): The query parameters, e.g. `{'subgroup': 'not excluded'}`.
+    - cache (LRUCache): The cache of rendered responses.
+
+    Returns:
+    - tuple: The content type and body of the response.
+    """
+    for pattern, files, render in ROUTES:
+        match = pattern.match(path)
+        if match is None:
+            continue
+        key = (tuple(file_hash(file) for file in files(match, query)), path, tuple(sorted(query.items())))
+        entry = cache.get(key)
+        if entry is None:
+            with _render_lock:
+                entry = render(match, query)
+            cache.put(key, entry)
+        return entry
+    raise KeyError(f'No page at {path}')
+
+
+def make_handler(cache):
+    """
+    Returns:
+    - type: A request handler class serving from `cache`.
+    """
+
+    class ReportHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            try:
+                content_type, body = respond(url.path, query, cache)
+                status = HTTPStatus.OK
+            except KeyError as error:
+                content_type, body, status = 'text/plain', str(error).encode(), HTTPStatus.NOT_FOUND
+            except (ValueError, SyntaxError) as error:
+                content_type, body, status = 'text/plain', str(error).encode(), HTTPStatus.BAD_REQUEST
+            except Exception as error:
+                # Any other failure of a report builder still gets a response instead of a dropped connection
+                self.log_error('%s', traceback.format_exc())
+                message = f'{type(error).__name__}: {error}'
+                content_type, body, status = 'text/plain', message.encode(), HTTPStatus.INTERNAL_SERVER_ERROR
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return ReportHandler
+
+
+def serve(host='127.0.0.1', port=8000, cache_bytes=CACHE_BYTES):
+    """
+    Serves the report on a local address until interrupted.
+
+    Parameters:
+    - host (str): The address to listen on, only the local machine by default.
+    - port (int): The port to listen on.
+    - cache_bytes (int): The size bound of the response cache.
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(LRUCache(cache_bytes)))
+    print(f'Serving results on http://{host}:{server.server_port}/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    serve()
+
+
+if __name__ == "__main__":
+    main()
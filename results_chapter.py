@@ -1,8 +1,14 @@
+import math
+
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 
+from figures import save_figure
+from profiling import profiled
+
 
+@profiled
 def load_and_normalize_data(csv_path):
     """Load data from CSV and normalize the percentages."""
     df = pd.read_csv(csv_path)
@@ -15,18 +21,50 @@ def load_and_normalize_data(csv_path):
     return df.melt(id_vars=['Question', 'Alternative'], var_name='Year', value_name='Percentage')
 
 
-def plot_bar_graph(df_melted, category):
-    """Plot bar graphs for each question."""
+@profiled
+def plot_bar_graph(df_melted, category, faceted=False, crops=False, columns=2):
+    """
+    Plot bar graphs for each question.
+
+    By default every question gets its own figure. With `faceted` all questions are drawn as subplots of one
+    figure saved as `./plots/<category>.png`, and `crops` additionally saves every subplot as
+    `./plots/<question>_<category>.png` from the same rendered figure.
+    """
     sns.set(style='whitegrid')
-    questions = df_melted['Question'].unique()
-    for question in questions:
-        plt.figure(figsize=(12, 8))
-        sns.barplot(x='Alternative', y='Percentage', hue='Year', data=df_melted[df_melted['Question'] == question])
-        plt.title(f'Comparison of {question} Across Years')
-        plt.ylabel('Percentage (%)')
-        plt.xlabel('Alternatives')
-        plt.legend(title='Year')
-        plt.savefig('./plots/' + question + '_' + category + '.png')
+    questions = df_melted.groupby('Question', sort=False)
+    if not faceted:
+        for question, question_data in questions:
+            plt.figure(figsize=(12, 8))
+            sns.barplot(x='Alternative', y='Percentage', hue='Year', data=question_data)
+            plt.title(f'Comparison of {question} Across Years')
+            plt.ylabel('Percentage (%)')
+            plt.xlabel('Alternatives')
+            plt.legend(title='Year')
+            save_figure(question + '_' + category)
+        return
+
+    rows = math.ceil(questions.ngroups / columns)
+    fig, axes = plt.subplots(rows, columns, figsize=(8 * columns, 5 * rows), squeeze=False)
+    # A shared scale, but every subplot keeps its own tick labels so the crops stand alone
+    top = df_melted['Percentage'].max() * 1.05
+    for ax, (question, question_data) in zip(axes.flat, questions):
+        sns.barplot(x='Alternative', y='Percentage', hue='Year', data=question_data, ax=ax)
+        ax.set_title(f'Comparison of {question} Across Years')
+        ax.set_ylabel('Percentage (%)')
+        ax.set_xlabel('Alternatives')
+        ax.set_ylim(0, top)
+        ax.legend(title='Year')
+    for ax in axes.flat[questions.ngroups:]:
+        ax.set_visible(False)
+    fig.tight_layout()
+    save_figure(category, fig)
+
+    if crops:
+        inverse = fig.dpi_scale_trans.inverted()
+        renderer = fig.canvas.get_renderer()
+        for ax, (question, _) in zip(axes.flat, questions):
+            extent = ax.get_tightbbox(renderer).transformed(inverse).padded(0.1)
+            save_figure(question + '_' + category, fig, bbox_inches=extent)
 
 
 def main():
@@ -34,11 +72,11 @@ def main():
     if category == 'proc':
         csv_path = './csv/mcqs_processes.csv'  # Replace with your actual CSV file path
         df_melted = load_and_normalize_data(csv_path)
-        plot_bar_graph(df_melted, "processes")
+        plot_bar_graph(df_melted, "processes", faceted=True, crops=True)
     else:
         csv_path = './csv/mcqs_virtual.csv'
         df_melted = load_and_normalize_data(csv_path)
-        plot_bar_graph(df_melted, "virtual")
+        plot_bar_graph(df_melted, "virtual", faceted=True, crops=True)
 
 
 if __name__ == "__main__":
@@ -4,7 +4,14 @@ from textwrap import dedent
 import numpy as np
 import pandas as pd
 
-def load_data(path):
+from profiling import profiled
+from schema import MULTI_SELECT, question_schema
+from subgroups import subgroup_index
+from utils import read_tsv
+
+
+@profiled
+def load_data(path, columns=None, pattern=None):
     def seconder(x):
         if '-' in x:
             return np.NAN
@@ -12,14 +19,12 @@ def load_data(path):
         td = timedelta(minutes=mins, seconds=secs)
         return td.total_seconds()
 
-    data = pd.read_csv(path, delimiter='\t', index_col=0)
-    data.loc['0':, 'tid'] = data.loc['0':, 'tid'].apply(lambda x: seconder(x))
+    data = read_tsv(path, columns, pattern)
+    if 'tid' in data.columns:
+        data.loc['0':, 'tid'] = data.loc['0':, 'tid'].apply(lambda x: seconder(x))
 
-    data.loc['0':, 'plattform'] = data.loc['0':, 'plattform'].apply(lambda x: x.split(',') if isinstance(x, str) else x)
-    data.loc['0':, 'andre_ressurser_proc'] = data.loc['0':, 'andre_ressurser_proc'].apply(
-        lambda x: x.split(',') if isinstance(x, str) else x)
-    data.loc['0':, 'andre_ressurser_virt'] = data.loc['0':, 'andre_ressurser_virt'].apply(
-        lambda x: x.split(',') if isinstance(x, str) else x)
+    for col in data.columns.intersection(MULTI_SELECT):
+        data.loc['0':, col] = data.loc['0':, col].apply(lambda x: x.split(',') if isinstance(x, str) else x)
     # Check if '0' exists in the DataFrame index to avoid errors
     if '0' in data.index:
         columns_to_skip = ['plattform', 'tid', 'andre_ressurser_proc', 'andre_ressurser_virt']
@@ -36,98 +41,132 @@ def load_data(path):
     return data
 
 
-def average_time(data):
+def responses(data, position, subgroup=None):
+    # Participant answers of the column at `position`, optionally restricted to a SubgroupIndex expression
+    schema = question_schema(data)
+    mask = None if subgroup is None else subgroup_index(data).mask(subgroup)
+    if schema.multi_select[position]:
+        answers = data.iloc[len(data.index) - len(schema.participants):, position]
+        return answers if mask is None else answers[mask]
+    return schema.answers(position, mask)
+
+
+def average_time(data, subgroup=None):
     # Calculate the average time for each category
-    avg_time = data.loc['0':, 'tid'].mean()
+    avg_time = responses(data, question_schema(data).position('tid'), subgroup).mean()
     return avg_time
 
 
-def plattform(data):
+def plattform(data, subgroup=None):
+    schema = question_schema(data)
+    position = schema.position('plattform')
     # Answer posibilities
-    answers = data.loc['answers', 'plattform'].split(', ')
+    answers = schema.options[position]
     # count all answers, remember they are in lists value_contes
-    exploded = data.loc['0':, 'plattform'].explode().astype(int)
+    exploded = responses(data, position, subgroup).explode().astype(int)
     distribution = exploded.value_counts(normalize=True).mul(100).round(2).sort_index()
     # answers as keys, and counts as values
     value_counts = {answers[i]: distribution[i] for i in range(len(answers))}
 
-    latex_string(answers, distribution, len(answers), exploded.dropna(), data.loc['questions', 'plattform'])
+    latex_string(answers, distribution, len(answers), exploded.dropna(), schema.texts[position])
 
 
-def hyppighet(data):
+def hyppighet(data, subgroup=None):
+    schema = question_schema(data)
+    position = schema.position('hyppighet')
     # Answer posibilities
-    answers = data.loc['answers', 'hyppighet'].split(', ')
+    answers = schema.options[position]
     # count all answers, remember they are in lists value_contes
-    exploded = data.loc['0':, 'hyppighet']
+    exploded = responses(data, position, subgroup)
     distribution = exploded.value_counts(normalize=True).mul(100).round(2).sort_index()
-    latex_string(answers, distribution, len(answers), exploded.dropna(), data.loc['questions', 'hyppighet'])
+    latex_string(answers, distribution, len(answers), exploded.dropna(), schema.texts[position])
 
 
-def mange_videoer(data, subsub, ext, include_statistics=False, print_alternatives=False):
+def mange_videoer(data, subsub, ext, include_statistics=False, print_alternatives=False, subgroup=None):
+    schema = question_schema(data)
+    position = schema.position('mange_videoer', ext)
     # Answer posibilities
-    answers = data.loc['answers', f'mange_videoer{ext}'].split(', ')
+    answers = schema.options[position]
     # count all answers, remember they are in lists value_contes
-    exploded = data.loc['0':, f'mange_videoer{ext}']
+    exploded = responses(data, position, subgroup)
     distribution = exploded.value_counts(normalize=True).mul(100).reindex(range(len(answers)), fill_value=0).round(
         2).sort_index()
     latex_string_v2(answers, distribution, len(answers), exploded.dropna(),
-                    data.loc['questions', f'mange_videoer{ext}'], subsub, print_alternatives, include_statistics
+                    schema.texts[position], subsub, print_alternatives, include_statistics
                     )
 
 
-def mange_i_snitt(data, subsub, ext, animated, include_statistics=False, print_alternatives=False):
-    col = f'mange_i_snitt{"_animert" if animated else ""}{ext}'
+def mange_i_snitt(data, subsub, ext, animated, include_statistics=False, print_alternatives=False, subgroup=None):
+    schema = question_schema(data)
+    position = schema.position('mange_i_snitt', ext, animated)
     # Answer posibilities
-    answers = data.loc['answers', col].split(', ')
+    answers = schema.options[position]
     # count all answers, remember they are in lists value_contes
-    exploded = data.loc['0':, col]
+    exploded = responses(data, position, subgroup)
     distribution = exploded.value_counts(normalize=True).mul(100).reindex(range(len(exploded)), fill_value=0).round(
         2).sort_index()
-    latex_string_v2(answers, distribution, len(answers), exploded.dropna(), data.loc['questions', col], subsub, print_alternatives, include_statistics)
+    latex_string_v2(answers, distribution, len(answers), exploded.dropna(), schema.texts[position], subsub, print_alternatives, include_statistics)
 
 
-def tidseffektivt(data, subsub, ext, animated, include_statistics=False, print_alternatives=False):
-    col = f'tidseffektivt{"_animert" if animated else ""}{ext}'
+def tidseffektivt(data, subsub, ext, animated, include_statistics=False, print_alternatives=False, subgroup=None):
+    schema = question_schema(data)
+    position = schema.position('tidseffektivt', ext, animated)
     # Answer posibilities
-    answers = data.loc['answers', col].split(', ')
+    answers = schema.options[position]
     # count all answers, remember they are in lists value_contes
-    exploded = data.loc['0':, col]
+    exploded = responses(data, position, subgroup)
     distribution = exploded.value_counts(normalize=True).mul(100).reindex(range(len(answers)), fill_value=0).round(
         2).sort_index()
-    latex_string_v2(answers, distribution, len(answers), exploded.dropna(), data.loc['questions', col], subsub, print_alternatives, include_statistics)
+    latex_string_v2(answers, distribution, len(answers), exploded.dropna(), schema.texts[position], subsub, print_alternatives, include_statistics)
 
 
-def laeringsutbytte(data, subsub, ext, animated, include_statistics, print_alternatives=False):
-    col = f'laeringsutbytte{"_animert" if animated else ""}{ext}'
+def laeringsutbytte(data, subsub, ext, animated, include_statistics, print_alternatives=False, subgroup=None):
+    schema = question_schema(data)
+    position = schema.position('laeringsutbytte', ext, animated)
     # Answer posibilities
-    answers = data.loc['answers', col].split(', ')
+    answers = schema.options[position]
     # count all answers, remember they are in lists value_contes
-    exploded = data.loc['0':, col]
+    exploded = responses(data, position, subgroup)
     distribution = exploded.value_counts(normalize=True).mul(100).reindex(range(len(answers)), fill_value=0).round(
         2).sort_index()
-    latex_string_v2(answers, distribution, len(answers), exploded.dropna(), data.loc['questions', col], subsub, print_alternatives, include_statistics)
+    latex_string_v2(answers, distribution, len(answers), exploded.dropna(), schema.texts[position], subsub, print_alternatives, include_statistics)
 
 
-def engasjerende(data, subsub, ext, animated, include_statistics, print_alternatives=False):
-    col = f'engasjerende{"_animert" if animated else ""}{ext}'
+def engasjerende(data, subsub, ext, animated, include_statistics, print_alternatives=False, subgroup=None):
+    schema = question_schema(data)
+    position = schema.position('engasjerende', ext, animated)
     # Answer posibilities
-    answers = data.loc['answers', col].split(', ')
+    answers = schema.options[position]
     # count all answers, remember they are in lists value_contes
-    exploded = data.loc['0':, col]
+    exploded = responses(data, position, subgroup)
     distribution = exploded.value_counts(normalize=True).mul(100).reindex(range(len(answers)), fill_value=0).round(
         2).sort_index()
-    latex_string_v2(answers, distribution, len(answers), exploded.dropna(), data.loc['questions', col], subsub, print_alternatives, include_statistics)
+    latex_string_v2(answers, distribution, len(answers), exploded.dropna(), schema.texts[position], subsub, print_alternatives, include_statistics)
 
 
-def andre_ressurser(data, ext, subsub, include_statistics, print_alternatives=False):
-    col = f'andre_ressurser{ext}'
+def andre_ressurser(data, ext, subsub, include_statistics, print_alternatives=False, subgroup=None):
+    schema = question_schema(data)
+    position = schema.position('andre_ressurser', ext)
     # Answer posibilities
-    answers = data.loc['answers', col].split(', ')
+    answers = schema.options[position]
     # count all answers, remember they are in lists value_contes
-    exploded = data.loc['0':, col].explode().replace('-', np.NAN).dropna().astype(int)
+    exploded = responses(data, position, subgroup).explode().replace('-', np.NAN).dropna().astype(int)
+    distribution = exploded.value_counts(normalize=True).mul(100).reindex(range(len(answers)), fill_value=0).round(
+        2).sort_index()
+    latex_string_v2(answers, distribution, len(answers), exploded.dropna(), schema.texts[position], subsub, print_alternatives, include_statistics)
+
+
+def question_table(data, position, subsub, include_statistics=True, print_alternatives=False, subgroup=None):
+    # The table of any question by position, as printed by the per-topic functions above
+    schema = question_schema(data)
+    answers = schema.options[position]
+    exploded = responses(data, position, subgroup)
+    if schema.multi_select[position]:
+        exploded = exploded.explode().replace('-', np.NAN).dropna().astype(int)
     distribution = exploded.value_counts(normalize=True).mul(100).reindex(range(len(answers)), fill_value=0).round(
         2).sort_index()
-    latex_string_v2(answers, distribution, len(answers), exploded.dropna(), data.loc['questions', col], subsub, print_alternatives, include_statistics)
+    latex_string_v2(answers, distribution, len(answers), exploded.dropna(), schema.texts[position], subsub,
+                    print_alternatives, include_statistics)
 
 
 def main():
@@ -164,6 +203,7 @@ def main():
     # andre_ressurser(data24)
 
 
+@profiled
 def latex_string(answer_alternatives, dist_values, num_alternatives, processed_values, question_text):
     def format_number(value):
         """
@@ -213,6 +253,7 @@ def latex_string(answer_alternatives, dist_values, num_alternatives, processed_v
     print(latex_string)
 
 
+@profiled
 def latex_string_v2(answer_alternatives, dist_values, num_alternatives, processed_values, question, subsection, print_alternatives2, include_statistics2):
     def format_number(value):
         """
@@ -0,0 +1,315 @@
+import glob
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from profiling import profiled
+from results_section import latex_string_v2
+from schema import MULTI_SELECT
+from utils import read_tsv, time_to_seconds
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cohorts (
+    cohort TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    source TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS questions (
+    cohort TEXT NOT NULL,
+    question TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    text TEXT,
+    answers TEXT,
+    correct_answer INTEGER,
+    PRIMARY KEY (cohort, question)
+);
+CREATE TABLE IF NOT EXISTS responses (
+    cohort TEXT NOT NULL,
+    question TEXT NOT NULL,
+    participant TEXT NOT NULL,
+    answer TEXT,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS responses_cohort_question ON responses (cohort, question, participant);
+CREATE INDEX IF NOT EXISTS responses_question ON responses (question, cohort);
+CREATE TABLE IF NOT EXISTS exam_scores (
+    cohort TEXT NOT NULL,
+    category TEXT NOT NULL,
+    participant TEXT NOT NULL,
+    score REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS exam_scores_cohort_category ON exam_scores (cohort, category, participant);
+CREATE TABLE IF NOT EXISTS aggregates (
+    cohort TEXT NOT NULL,
+    question TEXT NOT NULL,
+    statistic TEXT NOT NULL,
+    key TEXT NOT NULL DEFAULT '',
+    value REAL,
+    PRIMARY KEY (cohort, question, statistic, key)
+);
+"""
+
+def connect(path='results.sqlite'):
+    """
+    Opens the results database, creating the tables and indexes if needed.
+
+    Parameters:
+    - path (str): The path to the SQLite database file.
+
+    Returns:
+    - Connection: The open database connection.
+    """
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _replace_cohort(conn, cohort, kind, source):
+    for table in ['questions', 'responses', 'exam_scores', 'aggregates']:
+        conn.execute(f'DELETE FROM {table} WHERE cohort = ?', (cohort,))
+    conn.execute('INSERT OR REPLACE INTO cohorts VALUES (?, ?, ?)', (cohort, kind, source))
+
+
+def _moments(values):
+    return {'count': values.count(), 'mean': values.mean(), 'std': values.std(), 'skew': values.skew()}
+
+
+@profiled
+def ingest_survey(conn, path, cohort=None):
+    """
+    Loads a `resultater*.tsv` survey export into the database, replacing earlier data of the same cohort.
+
+    Besides the raw answers, the percentage distribution and moments of every question and the score
+    distribution of the q1-q5 questions of each topic are stored in `aggregates`.
+
+    Parameters:
+    - conn (Connection): An open database connection from `connect`.
+    - path (str): The path to the survey export.
+    - cohort (str): The cohort name, defaults to the file name without extension.
+    """
+    cohort = cohort or os.path.splitext(os.path.basename(path))[0]
+    data = read_tsv(path, dtype=str)
+    participants = data.iloc[3:]
+
+    questions = [(cohort, question, position, data.loc['questions', question], data.loc['answers', question],
+                  None if pd.isna(correct) or correct == '-' else int(correct))
+                 for position, (question, correct) in enumerate(data.loc['correct_answers'].items())]
+
+    answers = participants.rename_axis('participant').reset_index().melt(
+        id_vars='participant', var_name='question', value_name='answer').dropna(subset=['answer'])
+    # Multi-select questions get one response row per picked answer
+    multi = answers['question'].isin(MULTI_SELECT)
+    exploded = answers[multi].assign(answer=answers.loc[multi, 'answer'].str.split(',')).explode('answer')
+    exploded['answer'] = exploded['answer'].str.strip()
+    answers = pd.concat([answers[~multi], exploded], ignore_index=True)
+    answers['value'] = pd.to_numeric(answers['answer'], errors='coerce')
+    is_time = answers['question'] == 'tid'
+    answers.loc[is_time, 'value'] = time_to_seconds(answers.loc[is_time, 'answer'])
+
+    aggregates = []
+    for question, values in answers.groupby('question', sort=False)['value']:
+        values = values.dropna()
+        aggregates.extend((cohort, question, statistic, '', value) for statistic, value in _moments(values).items())
+        if question != 'tid':
+            distribution = values.value_counts(normalize=True).mul(100)
+            aggregates.extend((cohort, question, 'distribution', str(int(option)), percentage)
+                              for option, percentage in distribution.items())
+    for topic in ['proc', 'virt']:
+        columns = [f'q{i}_{topic}' for i in range(1, 6)]
+        if not set(columns).issubset(data.columns):
+            continue
+        correct = pd.to_numeric(data.loc['correct_answers', columns]).to_numpy()
+        answered = participants[columns].apply(pd.to_numeric, errors='coerce').to_numpy()
+        scores = pd.Series((answered == correct).sum(axis=1))
+        aggregates.extend((cohort, f'score_{topic}', statistic, '', value)
+                          for statistic, value in _moments(scores).items())
+        distribution = scores.value_counts(normalize=True).mul(100).reindex(range(6), fill_value=0)
+        aggregates.extend((cohort, f'score_{topic}', 'distribution', str(score), percentage)
+                          for score, percentage in distribution.items())
+
+    rows = answers.assign(cohort=cohort)[['cohort', 'question', 'participant', 'answer', 'value']].astype(object)
+    rows = rows.where(rows.notna(), None)
+
+    with conn:
+        _replace_cohort(conn, cohort, 'survey', path)
+        conn.executemany('INSERT INTO questions VALUES (?, ?, ?, ?, ?, ?)', questions)
+        conn.executemany('INSERT INTO responses VALUES (?, ?, ?, ?, ?)', rows.itertuples(index=False, name=None))
+        conn.executemany('INSERT INTO aggregates VALUES (?, ?, ?, ?, ?)', _without_nan(aggregates))
+
+
+@profiled
+def ingest_exam(conn, path, cohort=None):
+    """
+    Loads an `exam_results_*.tsv` export into the database, replacing earlier data of the same cohort.
+
+    The number of participants attempting each category (TRIES), their total points (POINTS) and the average
+    as computed by `exam_22.average_score` are stored in `aggregates`.
+
+    Parameters:
+    - conn (Connection): An open database connection from `connect`.
+    - path (str): The path to the exam export.
+    - cohort (str): The cohort name, defaults to the file name without extension.
+    """
+    cohort = cohort or os.path.splitext(os.path.basename(path))[0]
+    data = read_tsv(path, decimal=',').astype(float)
+    scores = data.rename_axis('category').rename_axis('participant', axis=1).stack().rename('score').reset_index()
+
+    tasks = data.drop(index='sum', errors='ignore')
+    totals = tasks.groupby(tasks.index.str[:-2], sort=False).sum()
+    attempted = totals > 0
+    tries = attempted.sum(axis=1)
+    points = totals.where(attempted, 0).sum(axis=1)
+    averages = points / tries.replace(0, np.nan)
+    aggregates = []
+    for category in totals.index:
+        aggregates.extend([(cohort, category, 'tries', '', tries[category]),
+                           (cohort, category, 'points', '', points[category]),
+                           (cohort, category, 'average', '', averages[category])])
+
+    with conn:
+        _replace_cohort(conn, cohort, 'exam', path)
+        conn.executemany('INSERT INTO exam_scores VALUES (?, ?, ?, ?)',
+                         scores.assign(cohort=cohort)[['cohort', 'category', 'participant', 'score']]
+                         .itertuples(index=False, name=None))
+        conn.executemany('INSERT INTO aggregates VALUES (?, ?, ?, ?, ?)', _without_nan(aggregates))
+
+
+def _without_nan(rows):
+    return [tuple(None if isinstance(value, float) and np.isnan(value) else
+                  value.item() if isinstance(value, np.generic) else value for value in row) for row in rows]
+
+
+def cohorts(conn, kind=None):
+    """
+    Returns:
+    - list: The names of the stored cohorts, optionally only those of one kind (`'survey'` or `'exam'`).
+    """
+    if kind is None:
+        rows = conn.execute('SELECT cohort FROM cohorts ORDER BY cohort')
+    else:
+        rows = conn.execute('SELECT cohort FROM cohorts WHERE kind = ? ORDER BY cohort', (kind,))
+    return [cohort for cohort, in rows]
+
+
+def question_mean(conn, question, cohort=None):
+    """
+    Calculates the mean answer of a question, over one cohort or pooled over all cohorts.
+
+    Parameters:
+    - conn (Connection): An open database connection.
+    - question (str): The question column, e.g. `'laeringsutbytte_animert_virt'`.
+    - cohort (str): The cohort, or None to pool every cohort that has the question.
+
+    Returns:
+    - float: The mean answer, or None if nobody answered the question.
+    """
+    if cohort is None:
+        row = conn.execute('SELECT AVG(value) FROM responses WHERE question = ?', (question,))
+    else:
+        row = conn.execute('SELECT AVG(value) FROM responses WHERE cohort = ? AND question = ?', (cohort, question))
+    return row.fetchone()[0]
+
+
+def question_means(conn, question):
+    """
+    Returns:
+    - Series: The mean answer and number of answers of a question for every cohort that has it.
+    """
+    return pd.read_sql_query('SELECT cohort, AVG(value) AS mean, COUNT(value) AS count FROM responses '
+                             'WHERE question = ? GROUP BY cohort ORDER BY cohort', conn, params=(question,),
+                             index_col='cohort')
+
+
+def responses(conn, cohort, question):
+    """
+    Returns:
+    - Series: The numeric answers of a question in a cohort, indexed by participant, like
+      `results_section.responses`. Multi-select questions have one entry per picked answer.
+    """
+    frame = pd.read_sql_query('SELECT participant, value FROM responses WHERE cohort = ? AND question = ? '
+                              'ORDER BY CAST(participant AS INTEGER)', conn, params=(cohort, question),
+                              index_col='participant')
+    return frame['value'].rename(question)
+
+
+def question_info(conn, cohort, question):
+    """
+    Returns:
+    - dict: The question `text`, the list of `answers` and the `correct_answer` (or None) of a question.
+    """
+    row = conn.execute('SELECT text, answers, correct_answer FROM questions WHERE cohort = ? AND question = ?',
+                       (cohort, question)).fetchone()
+    if row is None:
+        raise KeyError(f"Question '{question}' not found in cohort '{cohort}'")
+    text, answers, correct_answer = row
+    return {'text': text, 'answers': answers.split(', '), 'correct_answer': correct_answer}
+
+
+def aggregate(conn, cohort, question, statistic):
+    """
+    Reads a stored aggregate.
+
+    Parameters:
+    - conn (Connection): An open database connection.
+    - cohort (str): The cohort.
+    - question (str): The question, `score_proc`/`score_virt` for the q1-q5 scores or an exam category.
+    - statistic (str): `count`, `mean`, `std`, `skew`, `distribution`, `tries`, `points` or `average`.
+
+    Returns:
+    - float or Series: The value, or for distributions the percentage of each option indexed by option.
+    """
+    rows = conn.execute('SELECT key, value FROM aggregates WHERE cohort = ? AND question = ? AND statistic = ?',
+                        (cohort, question, statistic)).fetchall()
+    if statistic != 'distribution':
+        return rows[0][1] if rows else None
+    return pd.Series({int(key): value for key, value in rows}, dtype=float).sort_index()
+
+
+def distribution(conn, cohort, question):
+    """
+    Returns:
+    - Series: The rounded percentage distribution over all answer options, as passed to the LaTeX functions in
+      `results_section`.
+    """
+    num_options = len(question_info(conn, cohort, question)['answers'])
+    return aggregate(conn, cohort, question, 'distribution').reindex(range(num_options), fill_value=0).round(2)
+
+
+def exam_averages(conn, cohort):
+    """
+    Returns:
+    - dict: The average points per attempting participant of each exam category, highest first, like
+      `exam_22.average_score`.
+    """
+    rows = conn.execute("SELECT question, value FROM aggregates WHERE cohort = ? AND statistic = 'average' "
+                        'ORDER BY value DESC', (cohort,))
+    return dict(rows.fetchall())
+
+
+def latex_table(conn, cohort, question, subsection, include_statistics=True, print_alternatives=False):
+    """
+    Prints the LaTeX distribution table of a question from the stored data with `results_section.latex_string_v2`.
+    """
+    info = question_info(conn, cohort, question)
+    latex_string_v2(info['answers'], distribution(conn, cohort, question), len(info['answers']),
+                    responses(conn, cohort, question).dropna(), info['text'], subsection, print_alternatives,
+                    include_statistics)
+
+
+def main():
+    conn = connect()
+    for path in sorted(glob.glob('csv/resultater*.tsv')):
+        ingest_survey(conn, path)
+    for path in sorted(glob.glob('csv/exam_results_????.tsv')):
+        ingest_exam(conn, path)
+
+    print(question_means(conn, 'laeringsutbytte_virt'))
+    print(f"Pooled mean laeringsutbytte_animert_virt: {question_mean(conn, 'laeringsutbytte_animert_virt'):.2f}")
+    latex_table(conn, 'resultater24', 'tidseffektivt_animert_proc', '2024 - group animated')
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from utils import cached_per_frame
+
+# Columns where a participant can pick several answers, e.g. '1,2,4'
+MULTI_SELECT = ['plattform', 'andre_ressurser_proc', 'andre_ressurser_virt']
+
+# <topic>[_animert][_proc|_virt], where the scored questions are q<number>
+COLUMN_PATTERN = re.compile(r'^(?:q(?P<question>\d+)|(?P<topic>.+?))(?P<animated>_animert)?(?:_(?P<variant>proc|virt))?$')
+
+
+def parse_column(name):
+    """
+    Splits a column name into its schema key.
+
+    Parameters:
+    - name (str): The column name, e.g. `'tidseffektivt_animert_proc'` or `'q3_virt'`.
+
+    Returns:
+    - tuple: `(topic, variant, animated, question)`, e.g. `('tidseffektivt', 'proc', True, None)` or
+      `('q', 'virt', False, 3)`.
+    """
+    match = COLUMN_PATTERN.match(name)
+    question = match['question']
+    topic = 'q' if question is not None else match['topic']
+    return topic, match['variant'], match['animated'] is not None, None if question is None else int(question)
+
+
+def _variant(variant):
+    return variant.lstrip('_') if variant else None
+
+
+class QuestionSchema:
+    """
+    Integer positions and answer metadata for every column of a cohort, parsed once from the header and the
+    `questions`, `answers` and `correct_answers` rows.
+
+    Lookups go from `(topic, variant, animated, question)` to a position in `codes`, a participants x columns
+    float array of the numeric answers (NaN where a participant did not answer or for multi-select columns), so
+    the analyses slice arrays by position instead of building column names and slicing label ranges. Because the
+    positions come from the parsed names, reordering the columns of an export does not change any result.
+    """
+
+    def __init__(self, data):
+        self.columns = list(data.columns)
+        self.participants = data.index[data.index.get_loc('correct_answers') + 1:]
+        self.index = {column: position for position, column in enumerate(self.columns)}
+        self._positions = {parse_column(column): position for position, column in enumerate(self.columns)}
+        self.texts = data.loc['questions'].tolist()
+        self.options = [answers.split(', ') if isinstance(answers, str) and answers != '-' else []
+                        for answers in data.loc['answers']]
+        self.correct = pd.to_numeric(data.loc['correct_answers'], errors='coerce').to_numpy(dtype=float)
+        self.multi_select = np.isin(self.columns, MULTI_SELECT)
+
+        participants = data.loc[self.participants]
+        self.codes = np.full(participants.shape, np.nan)
+        for position, column in enumerate(self.columns):
+            if not self.multi_select[position]:
+                self.codes[:, position] = pd.to_numeric(participants[column], errors='coerce')
+
+    def position(self, topic, variant=None, animated=False, question=None):
+        """
+        Parameters:
+        - topic (str): The question topic, e.g. `'mange_i_snitt'`, or `'q'` for the scored questions.
+        - variant (str): `'proc'`, `'virt'` (a leading underscore is ignored) or None for general questions.
+        - animated (bool): Whether the question is about the animation video.
+        - question (int): The number of a scored question.
+
+        Returns:
+        - int: The position of the column.
+        """
+        key = (topic, _variant(variant), animated, question)
+        if key not in self._positions:
+            raise KeyError(f'No column for {key}')
+        return self._positions[key]
+
+    def positions(self, topic, variant=None, animated=False):
+        """
+        Returns:
+        - ndarray: The positions of all numbered questions of a topic, e.g. q1-q5 of a variant, by question number.
+        """
+        variant = _variant(variant)
+        found = sorted((key[3], position) for key, position in self._positions.items()
+                       if key[:3] == (topic, variant, animated) and key[3] is not None)
+        if not found:
+            raise KeyError(f'No columns for {(topic, variant, animated)}')
+        return np.array([position for _, position in found])
+
+    def column(self, position):
+        """
+        Returns:
+        - str: The column name at a position.
+        """
+        return self.columns[position]
+
+    def answers(self, position, mask=None):
+        """
+        Returns the numeric answers of one column.
+
+        Parameters:
+        - position (int): The position of the column.
+        - mask (ndarray): One boolean per participant selecting a subgroup, or None for all participants.
+
+        Returns:
+        - Series: The answers indexed by participant id.
+        """
+        if mask is None:
+            return pd.Series(self.codes[:, position], index=self.participants, name=self.columns[position])
+        return pd.Series(self.codes[mask, position], index=self.participants[mask], name=self.columns[position])
+
+    def correct_matrix(self, positions, correct=None):
+        """
+        Marks the correct answers of several scored questions.
+
+        Parameters:
+        - positions (ndarray): The positions of the questions.
+        - correct (ndarray): The correct answers to compare against, defaults to the cohort's own.
+
+        Returns:
+        - ndarray: A participants x questions boolean array.
+        """
+        correct = self.correct[positions] if correct is None else correct
+        return self.codes[:, positions] == correct
+
+
+@cached_per_frame
+def question_schema(data):
+    """
+    Returns the question schema of a loaded cohort, building it on first use and caching it with the frame.
+
+    Parameters:
+    - data (DataFrame): A cohort loaded with `test.load_data`, `results_section.load_data` or `utils.read_tsv`.
+
+    Returns:
+    - QuestionSchema: The schema for the cohort.
+    """
+    return QuestionSchema(data)
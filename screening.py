@@ -0,0 +1,194 @@
+import numpy as np
+import pandas as pd
+
+import results_section
+from profiling import profiled
+from schema import parse_column, question_schema
+from subgroups import subgroup_index
+from utils import time_to_seconds
+
+# Likert questions (Not watched, Very little, Little, Okay, A lot, Very much) used for straight-lining
+LIKERT_TOPICS = ['tidseffektivt', 'laeringsutbytte', 'engasjerende']
+
+# Scales the median absolute deviation to the standard deviation of a normal distribution
+MAD_SCALE = 1.4826
+
+# Masks registered in the subgroup index by `screen`
+MASK_NAMES = ['speeder', 'straightliner', 'excluded']
+
+
+def completion_times(data):
+    """
+    Returns the completion time of every participant in seconds.
+
+    Parameters:
+    - data (DataFrame): A cohort loaded with `results_section.load_data` (seconds) or read with `utils.read_tsv`
+      (`m:ss` strings). `test.load_data` turns the `m:ss` strings into NaN, so it cannot be used.
+
+    Returns:
+    - Series: The completion times indexed by participant id, NaN where the time is missing.
+    """
+    schema = question_schema(data)
+    times = data.loc[schema.participants, 'tid']
+    seconds = pd.to_numeric(times, errors='coerce').fillna(time_to_seconds(times)).astype(float)
+    if seconds.notna().sum() == 0:
+        raise ValueError("No completion times could be parsed from 'tid', load the cohort with "
+                         "results_section.load_data")
+    return seconds
+
+
+def time_thresholds(times=None, mad_factor=3.0, percentile=None, sketch=None):
+    """
+    Computes robust lower cutoffs for the completion time.
+
+    Parameters:
+    - times (array-like): Completion times in seconds, NaN is ignored. Not needed when `sketch` is given.
+    - mad_factor (float): Participants faster than `median - mad_factor * MAD` are speeders, with the MAD scaled
+      to a standard deviation. Left out when more than half of the times tie and the MAD is 0.
+    - percentile (float): Also require participants to be faster than this percentile, or None to only use the
+      MAD rule. On its own a percentile always flags that share of every cohort, so it only narrows the MAD rule.
+    - sketch (KLLSketch): A quantile sketch of the times, e.g. merged from per-file sketches by
+      `partitioned.aggregate_surveys`, to take approximate thresholds from in constant memory instead of
+      sorting `times`.
+
+    Returns:
+    - dict: The `median`, scaled `mad`, the `mad_cutoff` and the `percentile_cutoff` in seconds, NaN for a rule
+      that is not used, and the `cutoff` below which a participant is a speeder by every rule used, -inf when no
+      rule applies.
+    """
+    if sketch is not None:
+        median = sketch.quantile(0.5)
+        mad = MAD_SCALE * sketch.mad()
+        percentile_cutoff = np.nan if percentile is None else sketch.quantile(percentile / 100)
+    else:
+        times = np.asarray(times, dtype=float)
+        median = np.nanmedian(times)
+        mad = MAD_SCALE * np.nanmedian(np.abs(times - median))
+        percentile_cutoff = np.nan if percentile is None else np.nanpercentile(times, percentile)
+    # With a MAD of 0 the cutoff would be the median itself, flagging everyone faster than the tied times
+    mad_cutoff = median - mad_factor * mad if mad > 0 else np.nan
+    cutoffs = [cutoff for cutoff in [mad_cutoff, percentile_cutoff] if not np.isnan(cutoff)]
+    return {
+        'median': median,
+        'mad': mad,
+        'mad_cutoff': mad_cutoff,
+        'percentile_cutoff': percentile_cutoff,
+        'cutoff': min(cutoffs) if cutoffs else -np.inf,
+    }
+
+
+def answer_patterns(data, topics=None, ignore=(0,)):
+    """
+    Scores how uniformly every participant answered the Likert questions.
+
+    Parameters:
+    - data (DataFrame): A loaded cohort.
+    - topics (list): The Likert topics to include, defaults to `LIKERT_TOPICS`. All variants of a topic are used.
+    - ignore (tuple): Answer codes left out of the pattern, by default 'Not watched', which is the expected
+      answer everywhere for participants that did not watch the videos.
+
+    Returns:
+    - DataFrame: Per participant the number of `answered` items, the `modal_share` (share of items with the most
+      common answer, 1 for straight-lining) and the answer `entropy` normalised to [0, 1].
+    """
+    schema = question_schema(data)
+    topics = LIKERT_TOPICS if topics is None else topics
+    positions = [position for position, column in enumerate(schema.columns)
+                 if not schema.multi_select[position] and parse_column(column)[0] in topics]
+    codes = schema.codes[:, positions]
+    valid = ~np.isnan(codes) & ~np.isin(codes, ignore)
+    num_options = max(len(schema.options[position]) for position in positions)
+
+    # One histogram row per participant, built with a single bincount over (participant, code) pairs
+    rows = np.nonzero(valid)[0]
+    counts = np.bincount(rows * num_options + codes[valid].astype(int),
+                         minlength=len(schema.participants) * num_options).reshape(-1, num_options)
+    answered = counts.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = counts / answered[:, None]
+        entropy = -np.where(shares > 0, shares * np.log(shares), 0).sum(axis=1) / np.log(num_options)
+        modal_share = counts.max(axis=1) / answered
+    return pd.DataFrame({
+        'answered': answered,
+        'modal_share': np.where(answered > 0, modal_share, np.nan),
+        'entropy': np.where(answered > 0, entropy, np.nan),
+    }, index=schema.participants)
+
+
+@profiled
+def screen(data, mad_factor=3.0, percentile=None, min_items=4, max_entropy=0.0):
+    """
+    Flags speeders and straight-liners and registers the exclusion masks with the cohort's subgroup index.
+
+    After screening, every analysis taking a `subgroup` can leave out the flagged participants with
+    `subgroup='not excluded'`, or select them with `'speeder'`, `'straightliner'` or `'excluded'`.
+
+    Parameters:
+    - data (DataFrame): A loaded cohort.
+    - mad_factor (float): See `time_thresholds`.
+    - percentile (float): See `time_thresholds`.
+    - min_items (int): Participants need at least this many Likert answers to be flagged as straight-liners.
+    - max_entropy (float): Participants with a normalised answer entropy at or below this are straight-liners,
+      0 flags only participants that gave the same answer everywhere.
+
+    Returns:
+    - DataFrame: Per participant the completion `seconds`, robust z-score, answer pattern scores and the
+      `speeder`, `straightliner` and `excluded` flags. The thresholds are in `attrs['thresholds']`.
+    """
+    seconds = completion_times(data)
+    thresholds = time_thresholds(seconds, mad_factor, percentile)
+    screened = answer_patterns(data)
+    screened.insert(0, 'seconds', seconds.to_numpy())
+    # More than half of the times tying gives a MAD of 0, where the z-score is undefined
+    robust_z = (seconds.to_numpy() - thresholds['median']) / thresholds['mad'] if thresholds['mad'] > 0 else np.nan
+    screened.insert(1, 'robust_z', robust_z)
+    screened['speeder'] = (screened['seconds'] < thresholds['cutoff']).to_numpy()
+    screened['straightliner'] = ((screened['answered'] >= min_items) & (screened['entropy'] <= max_entropy)).to_numpy()
+    screened['excluded'] = screened['speeder'] | screened['straightliner']
+    screened.attrs['thresholds'] = thresholds
+
+    index = subgroup_index(data)
+    for name in MASK_NAMES:
+        index.add(name, screened[name].to_numpy())
+    return screened
+
+
+@profiled
+def compare_statistics(data, subgroup='not excluded'):
+    """
+    Reports how the statistics of every single-choice question change when participants are left out.
+
+    Parameters:
+    - data (DataFrame): A cohort that has been screened with `screen`.
+    - subgroup (str): The participants to keep, as a subgroup expression.
+
+    Returns:
+    - DataFrame: The count, mean, standard deviation and skewness of each question for all participants and for
+      the kept ones, and the change in mean.
+    """
+    schema = question_schema(data)
+    positions = np.flatnonzero(~schema.multi_select & (np.array(schema.columns) != 'tid'))
+    columns = [schema.column(position) for position in positions]
+    everyone = pd.DataFrame(schema.codes[:, positions], columns=columns)
+    kept = everyone[subgroup_index(data).mask(subgroup)]
+    statistics = ['count', 'mean', 'std', 'skew']
+    comparison = pd.concat({'all': everyone.agg(statistics).T, 'kept': kept.agg(statistics).T}, axis=1)
+    comparison[('change', 'mean')] = comparison[('kept', 'mean')] - comparison[('all', 'mean')]
+    return comparison
+
+
+def main():
+    for year in ['23', '24']:
+        data = results_section.load_data(f'csv/resultater{year}.tsv')
+        screened = screen(data)
+        thresholds = screened.attrs['thresholds']
+        print(f"20{year}: median time {thresholds['median']:.0f} s, speeder cutoff "
+              f"{thresholds['cutoff']:.0f} s")
+        print(screened[MASK_NAMES].sum().to_string())
+        print(compare_statistics(data).round(2).to_string())
+        results_section.tidseffektivt(data, f"20{year} - group screened", '_proc', False, True,
+                                      subgroup='not excluded')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import test
+from profiling import profiled
+from schema import question_schema
+from sparse_exam import ExamMatrix, load_exam_matrix
+from subgroups import subgroup_index
+
+# Shared memory blocks attached by this process, by block name, kept open for the lifetime of the worker
+_attached = {}
+
+
+class SharedArrays:
+    """
+    NumPy arrays copied once into `multiprocessing.shared_memory` blocks for worker processes to read.
+
+    Workers get a small descriptor (block names, shapes and dtypes) instead of the arrays themselves and `attach`
+    maps the blocks as read-only views, so a task costs a few hundred bytes of pickling however large the data
+    is. Use as a context manager, the blocks are freed when the block exits.
+    """
+
+    def __init__(self, arrays):
+        self._blocks = []
+        self.descriptor = {}
+        try:
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+                self._blocks.append(block)
+                np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+                self.descriptor[name] = (block.name, array.shape, array.dtype.str)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _open(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 every attachment is tracked, which is harmless for pool workers sharing the tracker
+        return shared_memory.SharedMemory(name=name)
+
+
+def attach(descriptor):
+    """
+    Maps the arrays of a `SharedArrays` descriptor without copying them.
+
+    Parameters:
+    - descriptor (dict): `SharedArrays.descriptor`.
+
+    Returns:
+    - dict: Read-only arrays by name, backed by the shared blocks.
+    """
+    views = {}
+    for name, (block_name, shape, dtype) in descriptor.items():
+        if block_name not in _attached:
+            _attached[block_name] = _open(block_name)
+        view = np.ndarray(shape, np.dtype(dtype), buffer=_attached[block_name].buf)
+        view.flags.writeable = False
+        views[name] = view
+    return views
+
+
+def _call(function, descriptor, *task):
+    return function(attach(descriptor), *task)
+
+
+@profiled
+def map_shared(function, arrays, tasks, processes=None):
+    """
+    Runs `function(arrays, *task)` for every task, with the arrays in shared memory when using worker processes.
+
+    Parameters:
+    - function (callable): A module-level function taking the dict of arrays and the task arguments. It must
+      not modify the arrays.
+    - arrays (dict): NumPy arrays by name, e.g. from `cohort_arrays` or `exam_arrays`.
+    - tasks (iterable): The argument tuples of every call, e.g. `[(seed,) for seed in seeds]`.
+    - processes (int): The number of worker processes, or None to run in this process.
+
+    Returns:
+    - list: The result of every task, in task order.
+    """
+    tasks = list(tasks)
+    if processes is None:
+        return [function(arrays, *task) for task in tasks]
+    if not tasks:
+        return []
+    with SharedArrays(arrays) as shared, ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(_call, repeat(function), repeat(shared.descriptor), *zip(*tasks)))
+
+
+def cohort_arrays(data, subgroups=()):
+    """
+    Collects the arrays of a loaded cohort that workers need, positions being those of `question_schema(data)`.
+
+    Parameters:
+    - data (DataFrame): A loaded cohort.
+    - subgroups (iterable): Subgroup expressions to evaluate once, e.g. `['not excluded']`.
+
+    Returns:
+    - dict: The participants x columns answer `codes`, the `correct` answer of every column and one row of
+      `masks` per subgroup expression.
+    """
+    schema = question_schema(data)
+    index = subgroup_index(data)
+    masks = np.array([index.mask(expression) for expression in subgroups], dtype=bool).reshape(-1, index.size)
+    return {'codes': schema.codes, 'correct': schema.correct, 'masks': masks}
+
+
+def exam_arrays(matrix):
+    """
+    Returns:
+    - dict: The CSR arrays and the sums of an `ExamMatrix`, for `exam_matrix` in the workers.
+    """
+    scores = matrix.scores
+    return {'data': scores.data, 'indices': scores.indices, 'indptr': scores.indptr, 'sums': matrix.sums}
+
+
+def exam_matrix(arrays, questions, participants):
+    """
+    Rebuilds an `ExamMatrix` around the arrays of `exam_arrays`, e.g. shared views, without copying the scores.
+    """
+    scores = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                               shape=(len(questions), len(participants)), copy=False)
+    return ExamMatrix(scores, questions, participants, arrays['sums'])
+
+
+def _bootstrap_score(arrays, positions, seed, num_resamples):
+    correct = arrays['codes'][:, positions] == arrays['correct'][positions]
+    scores = correct.sum(axis=1)[arrays['masks'][0]]
+    rng = np.random.default_rng(seed)
+    return scores[rng.integers(scores.size, size=(num_resamples, scores.size))].mean(axis=1)
+
+
+def _trimmed_averages(arrays, questions, participants, trim):
+    return exam_matrix(arrays, questions, participants).trim(trim).averages()
+
+
+def main():
+    data = test.load_data('csv/resultater24.tsv')
+    positions = question_schema(data).positions('q', 'proc')
+    seeds = np.random.SeedSequence(2024).spawn(8)
+    arrays = cohort_arrays(data, ['mange_i_snitt_animert_proc != 0'])
+    means = np.concatenate(map_shared(_bootstrap_score, arrays, [(positions, seed, 1000) for seed in seeds],
+                                      processes=4))
+    print(f'Mean q1-q5 score: 95% bootstrap interval {np.percentile(means, 2.5):.2f}-{np.percentile(means, 97.5):.2f}')
+
+    matrix = load_exam_matrix('csv/exam_results_2022.tsv')
+    trims = [0, 10, 33]
+    averages = map_shared(_trimmed_averages, exam_arrays(matrix),
+                          [(matrix.questions, matrix.participants, trim) for trim in trims], processes=3)
+    print(pd.concat(dict(zip(trims, averages)), axis=1).round(2).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.stats import f_oneway
+
+from exam_22 import POINTS, TRIES, TRIM
+from profiling import profiled
+from quantiles import trim_mask
+
+# Number of question rows parsed at once when loading an exam export
+CHUNK_ROWS = 8
+
+
+class ExamMatrix:
+    """
+    An exam export with questions as rows and participants as columns, holding only the non-zero scores.
+
+    Most participants skip most categories and a zero score means the question was not attempted, so the scores
+    are kept as a CSR matrix and attempts, averages and ANOVA groups are computed from its non-zero entries. The
+    `sum` row is kept separately as a dense array.
+    """
+
+    def __init__(self, scores, questions, participants, sums=None):
+        self.scores = sparse.csr_matrix(scores, dtype=float)
+        if (self.scores.data == 0).any():
+            # Only rewritten when needed, so read-only shared arrays can back the matrix
+            self.scores.eliminate_zeros()
+        self.questions = pd.Index(questions)
+        self.participants = pd.Index(participants)
+        self.sums = np.asarray(self.scores.sum(axis=0)).ravel() if sums is None else np.asarray(sums, dtype=float)
+        self.categories = pd.Index(self.questions.str[:-2].unique())
+        # Categories x questions indicator, so category totals are one sparse product
+        category_codes = self.categories.get_indexer(self.questions.str[:-2])
+        self._indicator = sparse.csr_matrix((np.ones(len(self.questions)), (category_codes,
+                                                                            np.arange(len(self.questions)))),
+                                            shape=(len(self.categories), len(self.questions)))
+
+    @classmethod
+    def from_frame(cls, data):
+        """
+        Parameters:
+        - data (DataFrame): An exam export as read by `exam_22.main` or `anova_exam22.fetch_exam_data`, NaN and
+          zero both meaning not attempted.
+
+        Returns:
+        - ExamMatrix: The non-zero scores of the export.
+        """
+        sums = data.loc['sum'].to_numpy(dtype=float) if 'sum' in data.index else None
+        questions = data.drop(index='sum', errors='ignore')
+        values = np.nan_to_num(questions.to_numpy(dtype=float))
+        return cls(values, questions.index, data.columns, sums)
+
+    def select(self, mask):
+        """
+        Returns:
+        - ExamMatrix: The participants where the boolean `mask` is True, in their original order.
+        """
+        columns = np.flatnonzero(mask)
+        return ExamMatrix(self.scores[:, columns], self.questions, self.participants[columns], self.sums[columns])
+
+    def trim(self, trim=TRIM, sketch=None):
+        """
+        Leaves out the `trim` participants with the highest and the lowest exam sums, as the filtered
+        `exam_22.calculate_scores` does.
+
+        Parameters:
+        - trim (int): The number of participants cut from each end.
+        - sketch (KLLSketch): A quantile sketch of the sums to take approximate cutoffs from instead of sorting.
+
+        Returns:
+        - ExamMatrix: The remaining participants.
+        """
+        if sketch is not None:
+            return self.select(trim_mask(self.sums, sketch, trim))
+        order = pd.Series(self.sums).sort_values(ascending=False).index.to_numpy()
+        mask = np.zeros(len(self.participants), dtype=bool)
+        mask[order[trim:len(order) - trim]] = True
+        return self.select(mask)
+
+    def category_totals(self):
+        """
+        Returns:
+        - csr_matrix: The categories x participants total scores, with no entry where a category was not attempted.
+        """
+        totals = self._indicator @ self.scores
+        totals.eliminate_zeros()
+        return totals
+
+    def _tries_and_points(self):
+        totals = self.category_totals()
+        rows = np.repeat(np.arange(totals.shape[0]), np.diff(totals.indptr))
+        # Only positive totals count as attempts, as in the dense loop of `exam_22.calculate_scores`
+        attempted = totals.data > 0
+        tries = np.bincount(rows, weights=attempted, minlength=totals.shape[0]).astype(int)
+        points = np.bincount(rows, weights=np.where(attempted, totals.data, 0), minlength=totals.shape[0])
+        return tries, points
+
+    def attempts(self):
+        """
+        Returns:
+        - Series: The number of participants with a positive total per category.
+        """
+        return pd.Series(self._tries_and_points()[0], index=self.categories)
+
+    def calculate_scores(self):
+        """
+        Returns:
+        - dict: `[TRIES, POINTS]` per category, the same as `exam_22.calculate_scores` on the dense export.
+        """
+        res_dict = {}
+        for category, tries, points in zip(self.categories, *self._tries_and_points()):
+            res_dict[category] = [0, 0]
+            res_dict[category][TRIES] = int(tries)
+            res_dict[category][POINTS] = float(points)
+        return res_dict
+
+    def averages(self):
+        """
+        Returns:
+        - Series: The average total score per category over the participants that attempted it, highest first.
+        """
+        res_dict = self.calculate_scores()
+        averages = pd.Series({category: res_dict[category][POINTS] / res_dict[category][TRIES]
+                              for category in res_dict if res_dict[category][TRIES]})
+        return averages.sort_values(ascending=False)
+
+    def groups(self):
+        """
+        Returns:
+        - list: The attempted (non-zero) scores of every question as arrays, the ANOVA groups of
+          `anova_exam22.main` without imputation.
+        """
+        return np.split(self.scores.data, self.scores.indptr[1:-1])
+
+    def to_frame(self):
+        """
+        Returns:
+        - DataFrame: The dense scores with NaN where a question was not attempted, as `anova_exam22.fetch_exam_data`
+          returns them without the `sum` row, e.g. for `imputation.impute`.
+        """
+        values = np.full(self.scores.shape, np.nan)
+        rows = np.repeat(np.arange(self.scores.shape[0]), np.diff(self.scores.indptr))
+        values[rows, self.scores.indices] = self.scores.data
+        return pd.DataFrame(values, index=self.questions, columns=self.participants)
+
+
+@profiled
+def load_exam_matrix(path, columns=None):
+    """
+    Reads an exam export a few question rows at a time, so the dense matrix is never held in memory.
+
+    Parameters:
+    - path (str): The path to an `exam_results_*.tsv` export.
+    - columns (iterable): Only parse the scores of these participant ids. Defaults to all participants.
+
+    Returns:
+    - ExamMatrix: The non-zero scores of the export.
+    """
+    usecols = None
+    if columns is not None:
+        header = pd.read_csv(path, delimiter='\t', nrows=0).columns[1:]
+        ids = pd.Index(columns).astype(str)
+        positions = header.get_indexer(ids)
+        if (positions < 0).any():
+            raise ValueError(f"Columns not found in {path}: {sorted(ids[positions < 0])}")
+        usecols = [0, *(positions + 1)]
+    chunks, questions, sums, participants = [], [], None, None
+    for chunk in pd.read_csv(path, delimiter='\t', index_col=0, decimal=',', usecols=usecols, chunksize=CHUNK_ROWS):
+        chunk = chunk.astype(float)
+        participants = chunk.columns
+        if 'sum' in chunk.index:
+            sums = chunk.loc['sum'].to_numpy()
+            chunk = chunk.drop(index='sum')
+        chunks.append(sparse.csr_matrix(np.nan_to_num(chunk.to_numpy())))
+        questions.extend(chunk.index)
+    return ExamMatrix(sparse.vstack(chunks, format='csr'), questions, participants, sums)
+
+
+def main():
+    matrix = load_exam_matrix('csv/exam_results_2022.tsv')
+    print(f'{matrix.scores.nnz} of {np.prod(matrix.scores.shape)} scores attempted')
+    print(matrix.attempts().to_string())
+    print(matrix.averages().round(2).to_string())
+    print(matrix.trim().averages().round(2).to_string())
+    f_stat, p_value = f_oneway(*matrix.groups())
+    print(f'Attempted scores only: F-statistic: {f_stat:.2f}, p-value: {p_value:.4f}')
+
+
+if __name__ == "__main__":
+    main()
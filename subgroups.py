@@ -0,0 +1,156 @@
+import ast
+
+import numpy as np
+import pandas as pd
+
+from utils import cached_per_frame
+
+
+class SubgroupIndex:
+    """
+    Named participant masks for one cohort, built once when the cohort is loaded.
+
+    Every answer option of every question with an `answers` row gets a bit-packed mask named
+    `<column>==<option>`, e.g. `mange_i_snitt_animert_proc==0` for the participants that never watched the
+    animation about processes. Masks are combined with Python-style expressions and every evaluated expression
+    is cached, so repeated selections for t-tests, plots and LaTeX tables cost a dictionary lookup.
+
+    Supported expressions:
+    - `column == option` and `column != option`
+    - `column in (option, ...)` and `column not in (option, ...)`
+    - `name` for masks registered with `add`
+    - `not`, `and`, `or` and parentheses to combine the above
+
+    Participants that did not answer a question are never `== option`, so they are always `!= option`.
+    """
+
+    def __init__(self, data):
+        self.participants = data.index[data.index.get_loc('correct_answers') + 1:]
+        self.size = len(self.participants)
+        self._masks = {}
+        self._cache = {}
+        for column in data.columns:
+            answers = data.loc['answers', column]
+            if not isinstance(answers, str) or answers == '-':
+                continue
+            options = _option_matrix(data.loc[self.participants, column], len(answers.split(', ')))
+            for option, selected in enumerate(options):
+                self._masks[f'{column}=={option}'] = np.packbits(selected)
+
+    def names(self):
+        """
+        Returns:
+        - list: The names of all masks that can be used in expressions.
+        """
+        return list(self._masks.keys())
+
+    def add(self, name, mask):
+        """
+        Registers an extra named mask, e.g. an exclusion mask computed outside the survey answers.
+
+        Parameters:
+        - name (str): A valid Python identifier used to refer to the mask in expressions.
+        - mask (array-like): One boolean per participant, in the order of `participants`.
+        """
+        if not name.isidentifier():
+            raise ValueError(f"Mask name '{name}' is not a valid identifier")
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != (self.size,):
+            raise ValueError(f"Mask '{name}' has shape {mask.shape}, expected ({self.size},)")
+        self._masks[name] = np.packbits(mask)
+        self._cache.clear()
+
+    def mask(self, expression):
+        """
+        Evaluates a subgroup expression.
+
+        Parameters:
+        - expression (str): The expression selecting the subgroup, e.g. `'mange_i_snitt_animert_proc != 0'`.
+
+        Returns:
+        - ndarray: One boolean per participant, True for participants in the subgroup.
+        """
+        packed = self._cache.get(expression)
+        if packed is None:
+            packed = self._evaluate(ast.parse(expression, mode='eval').body)
+            self._cache[expression] = packed
+        return np.unpackbits(packed, count=self.size).astype(bool)
+
+    def select(self, frame, expression):
+        """
+        Selects the rows of a participant-indexed DataFrame or Series that belong to a subgroup.
+
+        Parameters:
+        - frame (DataFrame or Series): Data indexed by participant ids, e.g. the output of
+          `test.calculate_correct_answers`.
+        - expression (str): The expression selecting the subgroup.
+
+        Returns:
+        - DataFrame or Series: The rows of `frame` for participants in the subgroup, in their original order.
+        """
+        return frame.loc[frame.index.isin(self.participants[self.mask(expression)])]
+
+    def _evaluate(self, node):
+        if isinstance(node, ast.BoolOp):
+            combine = np.bitwise_and if isinstance(node.op, ast.And) else np.bitwise_or
+            packed = self._evaluate(node.values[0])
+            for value in node.values[1:]:
+                packed = combine(packed, self._evaluate(value))
+            return packed
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return np.invert(self._evaluate(node.operand))
+        if isinstance(node, ast.Name):
+            return self._lookup(node.id)
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and isinstance(node.left, ast.Name):
+            column, op = node.left.id, node.ops[0]
+            value = ast.literal_eval(node.comparators[0])
+            if isinstance(op, (ast.Eq, ast.NotEq)):
+                packed = self._lookup(f'{column}=={value}')
+            elif isinstance(op, (ast.In, ast.NotIn)):
+                packed = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+                for option in value:
+                    packed = np.bitwise_or(packed, self._lookup(f'{column}=={option}'))
+            else:
+                raise ValueError(f"Unsupported comparison in subgroup expression: {ast.unparse(node)}")
+            return np.invert(packed) if isinstance(op, (ast.NotEq, ast.NotIn)) else packed
+        raise ValueError(f"Unsupported subgroup expression: {ast.unparse(node)}")
+
+    def _lookup(self, name):
+        if name not in self._masks:
+            raise KeyError(f"Unknown subgroup mask '{name}'")
+        return self._masks[name]
+
+
+def _option_matrix(values, num_options):
+    """
+    One boolean row per answer option, True where the participant picked that option.
+
+    Multi-select answers, either raw `'1,2,4'` strings or the lists made by `results_section.load_data`, mark every
+    selected option.
+    """
+    cells = pd.Series(values.to_numpy(), dtype=object)
+    is_text = cells.map(lambda value: isinstance(value, str))
+    cells = cells.where(~is_text, cells.astype(str).str.split(','))
+    codes = pd.to_numeric(cells.explode(), errors='coerce').dropna()
+    codes = codes[codes >= 0].astype(int)
+    num_options = max(num_options, codes.max() + 1 if len(codes) else 0)
+    matrix = np.zeros((num_options, len(cells)), dtype=bool)
+    matrix[codes.to_numpy(), codes.index.to_numpy()] = True
+    return matrix
+
+
+@cached_per_frame
+def subgroup_index(data):
+    """
+    Returns the subgroup index of a loaded cohort, building it on first use.
+
+    The index is cached for as long as `data` is alive, so every analysis of the same cohort shares the masks.
+    Build a new frame (e.g. by loading again) rather than mutating answers in place after the index is created.
+
+    Parameters:
+    - data (DataFrame): A cohort loaded with `test.load_data` or `results_section.load_data`.
+
+    Returns:
+    - SubgroupIndex: The subgroup index for the cohort.
+    """
+    return SubgroupIndex(data)
@@ -1,22 +1,32 @@
 import pandas as pd
-from scipy.stats import f_oneway, ttest_ind
+from scipy.stats import f_oneway
 import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
 from textwrap import dedent
 
+from figures import save_figure
+from patterns import AnswerPatterns, weighted_t_test
+from profiling import profiled
+from schema import question_schema
+from subgroups import subgroup_index
+from utils import read_tsv
 
-def load_data(file_path):
+
+@profiled
+def load_data(file_path, columns=None, pattern=None):
     """
     Loads data from a tab-separated values file.
 
     Parameters:
     - file_path (str): The path to the file containing the data.
+    - columns (iterable): Only parse these columns, e.g. `['q1_proc', 'q2_proc']`. Defaults to all columns.
+    - pattern (str or tuple): Only parse columns matching these shell-style patterns, e.g. `'*_proc'`.
 
     Returns:
     - DataFrame: A pandas DataFrame containing the loaded data.
     """
-    dataframe = pd.read_csv(file_path, delimiter='\t', index_col=0)
+    dataframe = read_tsv(file_path, columns, pattern)
 
     # Check if '0' exists in the DataFrame index to avoid errors
     if '0' in dataframe.index:
@@ -27,40 +37,25 @@ def load_data(file_path):
     return dataframe
 
 
-def calculate_correct_answers(data, start_col, end_col):
+@profiled
+def calculate_correct_answers(data, variant):
     """
     Calculates which answers are correct based on a row of correct answers.
 
     Parameters:
     - data (DataFrame): The DataFrame containing the test data.
-    - start_col (str): The name of the first column of answer data.
-    - end_col (str): The name of the last column of answer data.
+    - variant (str): The variant of the q1-q5 questions, `'proc'` or `'virt'`, found by name in any column order.
 
     Returns:
     - DataFrame: A DataFrame indicating True for correct answers and False for incorrect answers.
     """
-    correct_answers = data.loc['correct_answers', start_col:end_col]
-    participant_answers = data.loc['0':, start_col:end_col]
-    results_individual = participant_answers.apply(lambda x: (x == correct_answers), axis=1)
-    return results_individual
-
-
-def calculate_mean(results_individual):
-    """
-    Calculates the mean score for each participant.
-
-    Parameters:
-    - results_individual (DataFrame): A DataFrame where each row represents a participant and each column a question,
-      with True for correct answers and False for incorrect ones.
-
-    Returns:
-    - ndarray: An array containing the mean score for each participant.
-    """
-    mean_participant = results_individual.mean(axis=1)
-    mean_participant_array = mean_participant.to_numpy()
-    return mean_participant_array
+    schema = question_schema(data)
+    positions = schema.positions('q', variant)
+    return pd.DataFrame(schema.codes[:, positions] == schema.correct[positions], index=schema.participants,
+                        columns=[schema.column(position) for position in positions])
 
 
+@profiled
 def perform_one_way_anova(results_individual):
     """
     Performs a one-way ANOVA test on the given data.
@@ -76,47 +71,27 @@ def perform_one_way_anova(results_individual):
     return f_oneway(*results_individual.values)
 
 
-def calculate_variance(mean_participant_array):
-    """
-    Calculates the variance of the mean scores for participants.
-
-    Parameters:
-    - mean_participant_array (ndarray): An array containing the mean score for each participant.
-
-    Returns:
-    - float: The variance of the mean participant scores.
-    """
-    return np.var(mean_participant_array)
-
-
-def perform_t_test(array1, array2):
-    """
-    Performs Welch's t-test on two arrays of scores.
-
-    Parameters:
-    - array1 (ndarray): The first set of scores.
-    - array2 (ndarray): The second set of scores.
-
-    Returns:
-    - tuple: A tuple containing the T-statistic and the p-value of the test.
-    """
-    t_stat, p_value = ttest_ind(array1, array2, equal_var=True)
-    return t_stat, p_value
+def filter_out_not_seen_animation(data_2024, results_individual_2024, category):
+    return subgroup_index(data_2024).select(results_individual_2024, f'mange_i_snitt_animert_{category} != 0')
 
 
-def filter_out_not_seen_animation(data_2024, results_individual_2024, category):
-    return results_individual_2024.loc[
-        data_2024.loc[results_individual_2024.index, f'mange_i_snitt_animert_{category}'] != '0']
+def _scores(schema, data, postpend, correct_answers, subgroup):
+    scores = schema.correct_matrix(schema.positions('q', postpend), correct_answers).sum(axis=1)
+    if subgroup is None:
+        return pd.Series(scores, index=schema.participants)
+    mask = subgroup_index(data).mask(subgroup)
+    return pd.Series(scores[mask], index=schema.participants[mask])
 
 
-def plot_comparison_graph(data_2023, data_2024, postpend='proc', save_name='comparison'):
-    first_participant = data_2024.index[3]
-    correct_answers = data_2024.loc['correct_answers', f'q1_{postpend}':f'q5_{postpend}'].to_list()
-    res_2024 = data_2024.loc[first_participant:, f'q1_{postpend}':f'q5_{postpend}'].apply(lambda x: (x == correct_answers).sum(), axis=1)
+@profiled
+def plot_comparison_graph(data_2023, data_2024, postpend='proc', save_name='comparison', subgroup_2023=None,
+                          subgroup_2024=None):
+    schema_2024, schema_2023 = question_schema(data_2024), question_schema(data_2023)
+    correct_answers = schema_2024.correct[schema_2024.positions('q', postpend)]
+    res_2024 = _scores(schema_2024, data_2024, postpend, correct_answers, subgroup_2024)
     dist_2024 = res_2024.value_counts(normalize=True).mul(100).round(2).reindex(range(6)).sort_index()
 
-    first_participant = data_2023.index[3]
-    res_2023 = data_2023.loc[first_participant:, f'q1_{postpend}':f'q5_{postpend}'].apply(lambda x: (x == correct_answers).sum(), axis=1)
+    res_2023 = _scores(schema_2023, data_2023, postpend, correct_answers, subgroup_2023)
     dist_2023 = res_2023.value_counts(normalize=True).mul(100).round(2).reindex(range(6)).sort_index()
 
     print(save_name + " " + postpend + " 2024:\t" + str(res_2024.mean().round(2)))
@@ -157,15 +132,15 @@ def plot_comparison_graph(data_2023, data_2024, postpend='proc', save_name='comp
     plt.legend(title='Year')
 
     # Show the plot
-    plt.savefig(f'./plots/comparison_{postpend}_{save_name}.png')
+    save_figure(f'comparison_{postpend}_{save_name}')
 
 
 def main():
     postpend = 'virt'
     data_2024 = load_data('csv/resultater24.tsv')
     data_2023 = load_data('csv/resultater23.tsv')
-    # data_2024 = data_2024.loc[data_2024.loc[data_2024.index, f'mange_i_snitt_animert_{postpend}'] != 0]
-    # data_2023 = data_2023.loc[data_2023.loc[data_2023.index, f'mange_i_snitt_{postpend}'] != 0]
+    # subgroup_2024 = f'mange_i_snitt_animert_{postpend} != 0'
+    # subgroup_2023 = f'mange_i_snitt_{postpend} != 0'
 
     # question_list = data_2024.loc[:, 'q1_proc':'q5_proc'].columns.to_list()
     # question_list = data_2024.loc[:, f'q1_{postpend}':f'q5_{postpend}'].columns.to_list()
@@ -186,9 +161,11 @@ def print_that_latex():
     #
     # print("\n\nGruppe 1 vs Gruppe 2 som har sett animasjonsvideoen")
     # t_test_comparison('proc', data_2024, True)
-    # print_t_test_results(data_2024)
-    questions = [*data_2024.loc[:, 'tidseffektivt_proc':'engasjerende_proc'].columns.to_list()]
-    questions.extend(data_2024.loc[:, 'tidseffektivt_animert_proc':'engasjerende_animert_proc'].columns.to_list())
+    # print_t_test_results(data_2023, data_2024)
+    schema = question_schema(data_2024)
+    topics = ['tidseffektivt', 'laeringsutbytte', 'engasjerende']
+    questions = [schema.column(schema.position(topic, 'proc', animated))
+                 for animated in [False, True] for topic in topics]
     # questions.extend(data_2024.loc[:, 'tidseffektivt_virt':'engasjerende_virt'].columns.to_list())
     # questions.extend(data_2024.loc[:, 'tidseffektivt_animert_virt':'engasjerende_animert_virt'].columns.to_list())
     for question in questions:
@@ -197,9 +174,12 @@ def print_that_latex():
         answer_distribution(data_2024.copy(), question)
 
 
+@profiled
 def answer_distribution(data_2024, question):
-    dist_values = data_2024.loc[:, f'{question}'].value_counts(dropna=True, normalize=True).mul(100).reindex(range(6), fill_value=0).sort_index().round(2).to_list()
-    processed_values = data_2024.loc['0':, f'{question}'].dropna()
+    schema = question_schema(data_2024)
+    position = schema.index[question]
+    processed_values = schema.answers(position).dropna()
+    dist_values = processed_values.value_counts(normalize=True).mul(100).reindex(range(len(schema.options[position])), fill_value=0).sort_index().round(2).to_list()
     mean_value = processed_values.mean()
     std_dev_value = processed_values.std()
     skewness_value = processed_values.skew()
@@ -219,12 +199,15 @@ def answer_distribution(data_2024, question):
 
 
 
-def answer_distribution_actual(data, question):
-    row_start = data.index[3]
-    answer_alternatives = data.loc['answers', f'{question}'].split(',')
+@profiled
+def answer_distribution_actual(data, question, subgroup=None):
+    schema = question_schema(data)
+    position = schema.index[question]
+    answer_alternatives = schema.options[position]
     num_alternatives = len(answer_alternatives)
-    dist_values = data.loc[row_start:, f'{question}'].value_counts(dropna=True, normalize=True).mul(100).reindex(range(num_alternatives), fill_value=0).sort_index().round(2).to_list()
-    processed_values = data.loc[row_start:, f'{question}'].dropna()
+    answers = schema.answers(position, None if subgroup is None else subgroup_index(data).mask(subgroup))
+    dist_values = answers.value_counts(dropna=True, normalize=True).mul(100).reindex(range(num_alternatives), fill_value=0).sort_index().round(2).to_list()
+    processed_values = answers.dropna()
     mean_value = processed_values.mean()
     std_dev_value = processed_values.std()
     skewness_value = processed_values.skew()
@@ -234,7 +217,7 @@ def answer_distribution_actual(data, question):
     std_dev_value = format_number(std_dev_value)
     skewness_value = format_number(skewness_value)
 
-    correct_answer = int(data.loc['correct_answers', f'{question}'])
+    correct_answer = int(schema.correct[position])
     dist_values = [dist_values[correct_answer]] + sorted(
         dist_values[:correct_answer] + dist_values[correct_answer + 1:], reverse=True)
 
@@ -250,7 +233,7 @@ def answer_distribution_actual(data, question):
     dist_values_str = ' & '.join(map(str, dist_values[1:num_alternatives]))
 
 
-    question_text = data.loc['questions', f'{question}']
+    question_text = schema.texts[position]
 
     # Forming the complete LaTeX string
     latex_string = dedent(f"""\
@@ -259,12 +242,14 @@ def answer_distribution_actual(data, question):
 
     print(latex_string)
 
+@profiled
 def answer_distribution_actual_2(data, question):
-    answer_alternatives = data.loc['answers', f'{question}'].split(',')
-    num_alternatives = len(answer_alternatives)
+    schema = question_schema(data)
+    position = schema.index[question]
+    num_alternatives = len(schema.options[position])
     print(num_alternatives)
-    dist_values = data.loc['0':, f'{question}'].value_counts(dropna=True, normalize=True).mul(100).reindex(range(num_alternatives), fill_value=0).sort_index().round(2).to_list()
-    processed_values = data.loc['0':, f'{question}'].dropna()
+    processed_values = schema.answers(position).dropna()
+    dist_values = processed_values.value_counts(normalize=True).mul(100).reindex(range(num_alternatives), fill_value=0).sort_index().round(2).to_list()
     mean_value = processed_values.mean()
     std_dev_value = processed_values.std()
     skewness_value = processed_values.skew()
@@ -302,48 +287,48 @@ def format_number(value):
         return f'{value:.2f}'
 
 
-def print_t_test_results(data_2024):
+def print_t_test_results(data_2023, data_2024):
     category = 'virt'
     print("T test comparison for virtual memory questions, not seen animation filtered out")
-    t_test_comparison(category, data_2024.copy(), filter_out=True)
+    t_test_comparison(category, data_2023, data_2024, filter_out=True)
     print("T test comparison for virtual memory questions, not seen animation included")
-    t_test_comparison(category, data_2024.copy(), filter_out=False)
+    t_test_comparison(category, data_2023, data_2024, filter_out=False)
     category = 'proc'
     print("T test comparison for process questions, not seen animation filtered out")
-    t_test_comparison(category, data_2024.copy(), filter_out=True)
+    t_test_comparison(category, data_2023, data_2024, filter_out=True)
     print("T test comparison for process questions, not seen animation included")
-    t_test_comparison(category, data_2024.copy(), filter_out=False)
+    t_test_comparison(category, data_2023, data_2024, filter_out=False)
 
 
 def filter_out_not_seen_lecture(data_2023, results_individual_2023, category):
-    return results_individual_2023.loc[
-        data_2023.loc[results_individual_2023.index, f'mange_i_snitt_{category}'] != '0']
+    return subgroup_index(data_2023).select(results_individual_2023, f'mange_i_snitt_{category} != 0')
 
 
 def filter_out_seen_animation(data_2024, results_individual_2024, category):
-    return results_individual_2024.loc[
-        data_2024.loc[results_individual_2024.index, f'mange_i_snitt_animert_{category}'] == '0']
+    return subgroup_index(data_2024).select(results_individual_2024, f'mange_i_snitt_animert_{category} == 0')
 
 
 def t_test_comparison(category, data_2023, data_2024, filter_out=True):
-    results_individual_2024 = calculate_correct_answers(data_2024, f'q1_{category}', f'q5_{category}')
+    results_individual_2024 = calculate_correct_answers(data_2024, category)
     if filter_out:
         results_individual_2024 = filter_out_not_seen_animation(data_2024, results_individual_2024, category)
     else:
         results_individual_2024 = filter_out_seen_animation(data_2024, results_individual_2024, category)
     # print(results_individual_2024)
-    mean_participant_2024_array = calculate_mean(results_individual_2024)
+    patterns_2024 = AnswerPatterns(results_individual_2024.to_numpy(dtype=float))
+    mean_pattern_2024_array = patterns_2024.patterns.mean(axis=1)
     # one_way_anova_2024 = perform_one_way_anova(results_individual_2024)
     # 2023 data
-    results_individual_2023 = calculate_correct_answers(data_2023, f'q1_{category}', f'q5_{category}')
+    results_individual_2023 = calculate_correct_answers(data_2023, category)
     if filter_out:
         results_individual_2023 = filter_out_not_seen_lecture(data_2023, results_individual_2023, category)
-    mean_participant_2023_array = calculate_mean(results_individual_2023)
+    patterns_2023 = AnswerPatterns(results_individual_2023.to_numpy(dtype=float))
+    mean_pattern_2023_array = patterns_2023.patterns.mean(axis=1)
     # one_way_anova_2023 = perform_one_way_anova(results_individual_2023)
     # check if variance is ratio is less than 4:1
-    variance_2024 = calculate_variance(mean_participant_2024_array)
-    variance_2023 = calculate_variance(mean_participant_2023_array)
-    t_stat, p_value = perform_t_test(mean_participant_2024_array, mean_participant_2023_array)
+    variance_2024 = patterns_2024.moments(mean_pattern_2024_array)['var']
+    variance_2023 = patterns_2023.moments(mean_pattern_2023_array)['var']
+    t_stat, p_value = weighted_t_test(mean_pattern_2024_array, patterns_2024, mean_pattern_2023_array, patterns_2023)
     print("T-statistic:", t_stat)
     print("P-value:", p_value)
 
@@ -0,0 +1,48 @@
+import os
+import re
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+
+import plot_set
+from figures import collect, save_figure
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def count_pages(path):
+    with open(path, 'rb') as file:
+        return len(re.findall(rb'/Type\s*/Page\b', file.read()))
+
+
+def test_collect_one_page_per_saved_figure(tmp_path):
+    path = tmp_path / 'figures.pdf'
+    with collect(str(path), svg_dir=str(tmp_path / 'svg')) as saved:
+        for name in ['first', 'second', 'third']:
+            plt.figure()
+            plt.bar([0, 1], [1, 2])
+            save_figure(name)
+            plt.close('all')
+    assert saved == ['first', 'second', 'third']
+    assert count_pages(path) == 3
+    assert sorted(os.listdir(tmp_path / 'svg')) == ['first.svg', 'second.svg', 'third.svg']
+
+
+def test_chapter_has_one_page_per_category(tmp_path, monkeypatch):
+    monkeypatch.chdir(REPO_DIR)
+    path = tmp_path / 'results_chapter.pdf'
+    saved = plot_set.build_chapter(str(path))
+    assert len(saved) == len(plot_set.CHAPTER_CATEGORIES)
+    assert count_pages(path) == len(saved)
+
+
+def test_exam_plots(tmp_path, monkeypatch):
+    monkeypatch.chdir(REPO_DIR)
+    path = tmp_path / 'exam_results.pdf'
+    saved = plot_set.build_exam(str(path))
+    # Average scores and attempts, each filtered and unfiltered
+    assert len(saved) == 4
+    assert count_pages(path) == len(saved)
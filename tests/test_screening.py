@@ -0,0 +1,34 @@
+import numpy as np
+
+from screening import time_thresholds
+
+
+def test_tied_times_flag_no_speeders():
+    # More than half of the times tie, so the MAD is 0 and the MAD rule is left out instead of cutting at the median
+    times = np.array([300] * 6 + [200, 250, 280, 290])
+    thresholds = time_thresholds(times)
+    assert thresholds['mad'] == 0
+    assert np.isnan(thresholds['mad_cutoff'])
+    assert not (times < thresholds['cutoff']).any()
+
+
+def test_tied_times_with_percentile():
+    times = np.array([300] * 6 + [200, 250, 280, 290])
+    thresholds = time_thresholds(times, percentile=5)
+    assert list(times[times < thresholds['cutoff']]) == [200]
+
+
+def test_cohort_without_speeders():
+    times = np.linspace(500, 700, 41)
+    thresholds = time_thresholds(times)
+    assert thresholds['mad'] > 0
+    assert not (times < thresholds['cutoff']).any()
+    # Requiring the percentile rule as well never flags more than the MAD rule alone
+    assert not (times < time_thresholds(times, percentile=5)['cutoff']).any()
+
+
+def test_both_rules_must_agree():
+    times = np.concatenate([np.linspace(500, 700, 41), [60, 400]])
+    thresholds = time_thresholds(times, percentile=5)
+    assert thresholds['cutoff'] == min(thresholds['mad_cutoff'], thresholds['percentile_cutoff'])
+    assert list(times[times < time_thresholds(times)['cutoff']]) == [60]
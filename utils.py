@@ -1,7 +1,82 @@
+import functools
+import weakref
+from fnmatch import fnmatchcase
+
+import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 
+from figures import save_figure
+from profiling import profiled
+
+
+@profiled
+def read_tsv(path, columns=None, pattern=None, **options):
+    """
+    Reads a tab-separated results file, parsing only the columns an analysis needs.
+
+    The row headers (`questions`, `answers`, `correct_answers` and the participant ids) are always read. When
+    neither `columns` nor `pattern` is given, every column is parsed.
+
+    Parameters:
+    - path (str): The path to the file.
+    - columns (iterable): Column names to read, e.g. `['q1_proc', 'q2_proc']`.
+    - pattern (str or tuple): Shell-style pattern(s) for column names to read, e.g. `'*_proc'` or `'q?_virt'`.
+    - options: Extra keyword arguments for `pandas.read_csv`.
+
+    Returns:
+    - DataFrame: The file contents, with the columns in file order.
+    """
+    usecols = None
+    if columns is not None or pattern is not None:
+        header = pd.read_csv(path, delimiter='\t', nrows=0).columns[1:]
+        wanted = set(columns or ())
+        missing = wanted.difference(header)
+        if missing:
+            raise ValueError(f"Columns not found in {path}: {sorted(missing)}")
+        patterns = (pattern,) if isinstance(pattern, str) else tuple(pattern or ())
+        usecols = [0] + [position for position, name in enumerate(header, start=1)
+                         if name in wanted or any(fnmatchcase(name, p) for p in patterns)]
+    return pd.read_csv(path, delimiter='\t', index_col=0, usecols=usecols, **options)
+
+
+def cached_per_frame(build):
+    """
+    Decorator caching what `build(data)` returns for as long as the DataFrame `data` is alive.
+
+    Used for indexes derived from a loaded cohort, so every analysis of the same frame shares them. The cache
+    does not notice in-place changes, load the data again instead of editing it after building an index.
+    """
+    cache = {}
+
+    @functools.wraps(build)
+    def wrapper(data):
+        key = id(data)
+        entry = cache.get(key)
+        if entry is not None and entry[0]() is data:
+            return entry[1]
+        value = build(data)
+        cache[key] = (weakref.ref(data, lambda _, key=key: cache.pop(key, None)), value)
+        return value
+
+    return wrapper
+
+
+def time_to_seconds(times):
+    """
+    Converts `tid` answers such as `'9:07'` (minutes:seconds) to seconds, with NaN for anything else.
+
+    Parameters:
+    - times (Series): The `tid` strings.
+
+    Returns:
+    - Series: The completion times in seconds.
+    """
+    minutes_seconds = times.astype(str).str.extract(r'^\s*(\d+):(\d+(?:\.\d+)?)\s*$').astype(float)
+    return minutes_seconds[0] * 60 + minutes_seconds[1]
+
 
+@profiled
 def plot_bargraph(data, x, y, hue=None, title='', xlabel='', ylabel='', plot_type='bar', orientation='v', figsize=(10, 6)):
     plt.figure(figsize=figsize)
     if plot_type == 'bar':
@@ -44,14 +119,18 @@ def adjust_labels(alternatives):
     return [insert_line_breaks(alt) for alt in alternatives]
 
 
+@profiled
 def plot_comparison_bargraph(data, title, save_name):
     sns.set(style="whitegrid")
     plt.figure(figsize=(14, 8))
     bar_graph = sns.barplot(data=data, palette="viridis")
     bar_graph.set_ylabel("Average points")
     plt.title(f"{title}")
-    plt.savefig(f'./plots/{save_name}.png')
+    # Without a save name the figure stays open for the caller, e.g. the report server
+    if save_name is not None:
+        save_figure(save_name)
 
+@profiled
 def plot_bargraph(ylabel, title, save_name, x_labels, values, values2=None):
     x_labels = adjust_labels(x_labels)
     sns.set(style="whitegrid")
@@ -62,4 +141,6 @@ def plot_bargraph(ylabel, title, save_name, x_labels, values, values2=None):
     end = int(max(values)) + 10
     plt.ylim(start, end)
     plt.title(f"{title}")
-    plt.savefig(f'./plots/{save_name}.png')
+    # Without a save name the figure stays open for the caller, e.g. the report server
+    if save_name is not None:
+        save_figure(save_name)